@@ -1,16 +1,26 @@
 from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
-import asyncio, os, subprocess, alsaaudio, shutil, requests
+from fastapi.responses import HTMLResponse, Response
+from fastapi import HTTPException
+import asyncio, os
 from asyncio import sleep
 import uvicorn
+from functools import partial
 
-from models import Mixin
+from models import Mixin, LiveRatio
 from utils.init import config
-from utils.files import create_vol_file, change_audio_order
+from utils.files import change_audio_order
+from utils.volume import volume_controller
+from utils.recordings import recordings_index
+from utils.retention import retention_manager
+from utils.archive import archive
 from utils.log_conf import app_log_conf
+from utils import http_client
+from utils.http_client import get_sync_session, get_pool_statistics
+from utils.playback_control import start_control_server
+from utils.audio_player import play_audio_file, stop_current_playback, get_playback_state, handle_control_command, sound_library
 from utils.websocket_streaming import start_websocket_streaming, get_websocket_streamer
-from bs_sound_utils.sound_mix import mix_by_ratio
-from main import initPyaudio, heartbeat, record_stream, welcome_sound, websocket_streaming_task
+from bs_sound_utils.sound_mix import mix_by_ratio, copy_mix, start_live_mix, set_live_ratio, validate_mix, validate_ratio
+from main import initPyaudio, heartbeat, capture_stream, welcome_sound, gRecord_buffer, gSound_meter
 if config.get('audio', 'audio_card') == 'core_v2':
     from utils.user_button import button_run
 else:
@@ -29,35 +39,49 @@ prepared_dir = config['files']['sound_dir']
 @app.on_event("startup")
 async def startup():
     os.makedirs(record_dir, exist_ok=True)
+    # 녹음 파일 인덱스 (이후에는 세그먼트 저장 시 갱신)
+    await asyncio.get_running_loop().run_in_executor(None, recordings_index.scan)
+    # 마스킹 음원 미리 매핑
+    await asyncio.get_running_loop().run_in_executor(None, sound_library.preload)
     is_update = os.path.isfile('../update')
     if config.getboolean('options_using', 'use_welcome_sound') and (is_update == False):
         welcome_sound()
         await sleep(3)
     stream, samplesize = initPyaudio() 
+    # 로컬 재생 제어 채널 (file_monitor 등 같은 기기의 프로세스용)
+    await start_control_server(config.get('speaker', 'control_socket', fallback='/tmp/smart-speaker.sock'), handle_control_command)
     
     # WebSocket 스트리밍 태스크 시작
     if config.getboolean('options_using', 'websocket_streaming'):
-        # 백그라운드에서 WebSocket 스트리밍 시작
+        # 백그라운드에서 WebSocket 스트리밍 시작 (콜백 청크는 스트리머 큐로 바로 전달)
         asyncio.create_task(start_websocket_streaming())
-        # WebSocket 스트리밍 처리 태스크 시작
-        asyncio.create_task(websocket_streaming_task())
     
     # 기존 태스크들을 백그라운드에서 실행
     asyncio.create_task(button_run())
     asyncio.create_task(heartbeat())
-    asyncio.create_task(record_stream(stream, samplesize))
+    asyncio.create_task(capture_stream(stream, samplesize))
+    if config.getboolean('retention', 'enabled', fallback=False):
+        asyncio.create_task(retention_manager.run())
+
+@app.on_event("shutdown")
+async def shutdown():
+    # 지연 중인 볼륨 저장
+    volume_controller.flush()
+    # 공유 HTTP 연결 풀 정리
+    await http_client.close()
     
 @app.get('/')
 async def home():
     readySoundItems=''
     for file in os.listdir(prepared_dir):
         readySoundItems = readySoundItems + f"""<div> {file} <button onclick="playRequest('ready', '{file}')">실행</button> </div><br>"""
+    # 최근 녹음만 표시하고 나머지는 /api/recordings 페이지 단위로 불러옴
+    recent = recordings_index.page(limit=config.getint('files', 'home_recordings', fallback=20))
     recordedItems=''
-    files = os.listdir(record_dir)
-    sorted_files = sorted(files, key=lambda x: os.path.getmtime(os.path.join(record_dir, x)), reverse=True)
-    
-    for file in sorted_files:
-        recordedItems = recordedItems + f"""<div> {file} <button onclick="playRequest('record', '{file}')">실행</button> </div><br>"""
+    for item in recent["items"]:
+        recordedItems = recordedItems + f"""<div> {item['name']} <button onclick="playRequest('record', '{item['name']}')">실행</button> </div><br>"""
+    recordedItems = recordedItems + f"""<div id="moreRecordings"></div>
+        <button id="moreButton" onclick="loadRecordings()" {'' if recent['total'] > len(recent['items']) else 'hidden'}>더 보기 ({recent['total']}개 중 <span id="shownCount">{len(recent['items'])}</span>개 표시)</button>"""
     
     # WebSocket 스트리밍 상태 정보
     websocket_status = ""
@@ -109,6 +133,27 @@ async def home():
                 xhr.onload = function(){}; //응답값 무시
                 xhr.send();
                 }
+            function loadRecordings(){
+                var shown = parseInt(document.getElementById('shownCount').textContent);
+                var xhr = new XMLHttpRequest();
+                xhr.open('GET', '/api/recordings?offset='+shown+'&limit=50', true);
+                xhr.onload = function(){
+                    var page = JSON.parse(xhr.responseText);
+                    var more = document.getElementById('moreRecordings');
+                    page.items.forEach(function(item){
+                        var div = document.createElement('div');
+                        var button = document.createElement('button');
+                        button.textContent = '실행';
+                        button.onclick = function(){ playRequest('record', item.name); };
+                        div.append(item.name + ' ', button);
+                        more.append(div, document.createElement('br'));
+                    });
+                    shown += page.items.length;
+                    document.getElementById('shownCount').textContent = shown;
+                    if(shown >= page.total){ document.getElementById('moreButton').hidden = true; }
+                };
+                xhr.send();
+            }
             function refreshStatus(){
                 location.reload();
                 }
@@ -339,30 +384,64 @@ async def toggle_websocket_streaming():
 @app.get('/control/play/{reqType}/{wavfile}')
 async def playWav(reqType, wavfile):
     if reqType == 'ready':
-        subprocess.Popen(['./utils/repeat_play.sh', config['audio']['cardindex'], config['audio']['deviceindex'], os.path.join(prepared_dir, wavfile) ])
-        # subprocess.Popen(['aplay', '-D', f"plughw:{config['audio']['cardindex']},{config['audio']['deviceindex']}", os.path.join(prepared_dir, wavfile) ])
+        play_audio_file(os.path.join(prepared_dir, wavfile), loop=True)
     else:
-        subprocess.Popen(['./utils/repeat_play.sh', config['audio']['cardindex'], config['audio']['deviceindex'], os.path.join(record_dir, wavfile) ])
-        # subprocess.Popen(['aplay', '-D', f"plughw:{config['audio']['cardindex']},{config['audio']['deviceindex']}", os.path.join(record_dir,wavfile) ])
+        play_audio_file(os.path.join(record_dir, wavfile), loop=True)
 
 @app.get('/control/stop')
-async def playWav():
-    subprocess.Popen(['pkill', '-9', 'repeat_play' ])
-    subprocess.Popen(['pkill', '-9', 'aplay' ])
+async def stopWav():
+    stop_current_playback()
+
+@app.get('/api/status/playback')
+async def check_playback_status():
+    return dict(get_playback_state(), library=sound_library.get_statistics())
 
 @app.get('/control/volume/{value}')
-async def control_volume(value: int):
-    m = alsaaudio.Mixer(control=config.get('audio', 'mixer_control'), cardindex=config.getint('audio', 'cardindex'))
-    m.setvolume(value) # Set the volume to custom value
-    create_vol_file(value)
+async def control_volume(value: int, ramp: float = None):
+    duration = config.getfloat('speaker', 'volume_ramp', fallback=0.2) if ramp is None else ramp
+    if duration > 0:
+        volume_controller.ramp(value, duration)
+    else:
+        volume_controller.set(value)
     return "ok"
 
 @app.get('/api/status/volume')
 async def check_volume_level():
-    m = alsaaudio.Mixer(control=config.get('audio', 'mixer_control'), cardindex=config.getint('audio', 'cardindex'))
-    current_volume = m.getvolume() # Get the current Volume
-    return {"res": current_volume[0]}
+    return {"res": volume_controller.get()}
     
+@app.get('/api/status/capture')
+async def check_capture_status():
+    return gRecord_buffer.get_statistics()
+
+@app.get('/api/status/level')
+async def check_sound_level():
+    return gSound_meter.get_statistics()
+
+@app.get('/api/status/storage')
+async def check_storage():
+    return await asyncio.get_running_loop().run_in_executor(None, retention_manager.get_statistics)
+
+@app.get('/api/status/http')
+async def check_http_pools():
+    return get_pool_statistics()
+
+@app.get('/api/recordings')
+async def list_recordings(offset: int = 0, limit: int = 50, since: float = None, until: float = None,
+                          event: bool = None, q: str = None):
+    return recordings_index.page(max(offset, 0), max(1, min(limit, 500)), since, until, event, q)
+
+@app.get('/api/archive')
+async def list_archive():
+    return await asyncio.get_running_loop().run_in_executor(None, archive.files)
+
+@app.get('/api/archive/extract')
+async def extract_archive(start: float, end: float):
+    if not 0 < end - start <= config.getfloat('archive', 'max_extract_seconds', fallback=600):
+        raise HTTPException(status_code=400, detail="invalid time range")
+    data = await asyncio.get_running_loop().run_in_executor(None, archive.extract_wav, start, end)
+    return Response(content=data, media_type='audio/wav',
+                    headers={'Content-Disposition': f'attachment; filename="archive-{int(start)}-{int(end)}.wav"'})
+
 @app.get('/api/playlist')
 async def playlist():
     files = os.listdir(prepared_dir)
@@ -372,19 +451,51 @@ async def playlist():
 
 @app.post('/api/mix/preview')
 async def mix_and_preview_wavfiles(mix : Mixin):
-    filename = mix_by_ratio(mix.files, mix.ratio)
-    subprocess.Popen(['aplay', '-D', f"plughw:{config['audio']['cardindex']},{config['audio']['deviceindex']}", filename ])
+    # 렌더링은 이벤트 루프 밖에서, 재생은 렌더링과 동시에 시작
+    filename = await asyncio.get_running_loop().run_in_executor(
+        None, partial(mix_by_ratio, mix.files, mix.ratio, dir=prepared_dir, preview=True))
     return filename
 
 @app.post('/api/mix/save/{savename}')
-async def mix_and_preview_wavfiles(savename: str, mix : Mixin):
+async def mix_and_save_wavfiles(savename: str, mix : Mixin):
     savename = f"{savename}.wav"
-    filename = mix_by_ratio(mix.files, mix.ratio)
+    loop = asyncio.get_running_loop()
+    filename = await loop.run_in_executor(None, partial(mix_by_ratio, mix.files, mix.ratio, dir=prepared_dir))
     result_file = os.path.join(prepared_dir, savename)
-    shutil.move(filename, result_file)
-    files = {'file': (savename, open(result_file, 'rb'), 'audio/wav')}
-    res = requests.post("https://home-therapy.bs-soft.co.kr/api/upload-mixedfile", files=files)
+    # 캐시된 믹스는 남겨두고 복사본을 이름 변경으로 교체 (재생 중인 매핑 보호)
+    try:
+        await loop.run_in_executor(None, copy_mix, filename, result_file)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="mix was pruned from the cache, retry the request")
+    with open(result_file, 'rb') as f:
+        files = {'file': (savename, f, 'audio/wav')}
+        res = await loop.run_in_executor(None, partial(get_sync_session().post, "https://home-therapy.bs-soft.co.kr/api/upload-mixedfile", files=files))
     return {"result": res.text} 
 
+@app.post('/api/live/start')
+async def start_live(mix : Mixin):
+    try:
+        validate_mix(mix.files, mix.ratio)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await asyncio.get_running_loop().run_in_executor(None, partial(start_live_mix, mix.files, mix.ratio, dir=prepared_dir))
+
+@app.post('/api/live/ratio')
+async def change_live_ratio(live : LiveRatio):
+    try:
+        validate_ratio(live.ratio)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"res": set_live_ratio(live.index, live.ratio)}
+
+@app.post('/api/live/stop')
+async def stop_live():
+    stop_current_playback()
+    return "ok"
+
+@app.get('/api/live')
+async def live_status():
+    return get_playback_state()
+
 if __name__ == '__main__':
     uvicorn.run("app:app", host='0.0.0.0', port=80, reload=True, log_config=app_log_conf, log_level='info')
@@ -1,23 +1,175 @@
-import os
-from pydub import AudioSegment
-
-def match_target_amplitude(sound, target_dBFS):
-    change_in_dBFS = target_dBFS - sound.dBFS
-    return sound.apply_gain(change_in_dBFS)
-
-
-def mix_by_ratio(files: list, ratios: list, dir="sounds"):
-    audios = files.copy()
-    for i, file in enumerate(files):
-        print(i)
-        audios[i] = AudioSegment.from_wav(os.path.join(dir, file))
-        print(audios[i].dBFS)
-        audio = match_target_amplitude(audios[i], audios[i].dBFS*(0.5/ratios[i]))
-        print(audio.dBFS)
-        if i != 0:
-            audios[i] = audios[i-1].overlay(audio)
-    audios[-1].export("mixed.wav", format="wav")
-    return "mixed.wav"
+import os, hashlib, shutil, threading, wave
+import numpy as np
+from utils.init import config
+from utils.metering import power_to_db
+from utils.playback_engine import resample
+from utils.audio_player import sound_library, engine, play_audio_file
+
+MIX_BLOCK = 48000  # 렌더링 블록 크기 (프레임)
+mix_dir = config.get('files', 'mix_dir', fallback='./mixes')
+max_cached_mixes = config.getint('files', 'max_cached_mixes', fallback=16)
+_render_locks = {}  # 출력 경로별 렌더링 잠금 (같은 믹스를 동시에 두 번 만들지 않음)
+_render_locks_lock = threading.Lock()
+_cache_lock = threading.Lock()  # 캐시 정리와 믹스 결과 복사가 겹치지 않도록 함
+
+
+def pcm_dbfs(pcm):
+    """PCM 전체의 dBFS"""
+    samples = pcm.astype(np.float64)
+    return float(power_to_db(float(np.dot(samples, samples)) / max(len(samples), 1)))
+
+
+def ratio_gain(dbfs, ratio):
+    """비율에 따른 선형 게인 (목표 dBFS = dBFS * (0.5 / ratio))"""
+    if ratio <= 0:
+        return 0.0
+    gain_db = dbfs * (0.5 / ratio) - dbfs
+    return 10 ** (gain_db / 20)
+
+
+def mix_gain(pcm, ratio):
+    return ratio_gain(pcm_dbfs(pcm), ratio)
+
+
+def _mix_path(files, ratios, dir):
+    """(파일, 비율, 원본 변경 시각)으로 정해지는 믹스 결과 경로"""
+    key = repr((list(files), [float(r) for r in ratios]))
+    for file in files:
+        stat = os.stat(os.path.join(dir, file))
+        key += f"|{stat.st_mtime_ns}:{stat.st_size}"
+    return os.path.join(mix_dir, f"mix-{hashlib.sha1(key.encode()).hexdigest()[:16]}.wav")
+
+
+def _load_tracks(files, ratios, dir):
+    """(PCM, 게인) 목록과 출력 샘플레이트, 채널 수, 길이 (첫 파일 기준) 반환"""
+    sources = []
+    for file, ratio in zip(files, ratios):
+        pcm, rate, channels = sound_library.get(os.path.join(dir, file))
+        sources.append((pcm.reshape(-1, channels), rate, channels, mix_gain(pcm, ratio)))
+    rate = max(s[1] for s in sources)
+    channels = max(s[2] for s in sources)
+    tracks = [(resample(pcm, src_rate, rate), gain) for pcm, src_rate, _, gain in sources]
+    return tracks, rate, channels, len(tracks[0][0])
+
+
+def render_mix(tracks, out, progress=None):
+    """out ((프레임, 채널) int16)에 블록 단위로 믹스 (모노 트랙은 브로드캐스팅으로 모든 채널에 더함)"""
+    for start in range(0, len(out), MIX_BLOCK):
+        end = min(start + MIX_BLOCK, len(out))
+        acc = np.zeros((end - start, out.shape[1]), dtype=np.float32)
+        for pcm, gain in tracks:
+            block = pcm[start:end]
+            if gain and len(block):
+                acc[:len(block)] += block * np.float32(gain)
+        np.clip(acc, -32768, 32767, out=acc)
+        out[start:end] = acc
+        if progress is not None:
+            progress(end)
+
+
+def _write_wav(path, pcm, rate, channels):
+    tmp_path = f"{path}.{threading.get_ident()}.part"
+    with wave.open(tmp_path, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm.tobytes())
+    os.replace(tmp_path, path)
+
+
+def _prune_cache():
+    """오래된 믹스 결과 정리"""
+    mixes = [os.path.join(mix_dir, f) for f in os.listdir(mix_dir) if f.startswith('mix-') and f.endswith('.wav')]
+    mixes.sort(key=os.path.getmtime, reverse=True)
+    with _cache_lock:
+        for path in mixes[max_cached_mixes:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def copy_mix(path, dst):
+    """캐시된 믹스 결과를 dst 로 복사 (이미 정리된 경우 FileNotFoundError)"""
+    with _cache_lock:
+        shutil.copyfile(path, f"{dst}.part")
+    os.replace(f"{dst}.part", dst)
+
+
+def mix_by_ratio(files: list, ratios: list, dir="sounds", preview=False):
+    """files 를 ratios 비율로 믹스한 WAV 경로 반환 (같은 조합은 캐시된 결과 재사용)
+
+    preview=True 이면 렌더링하면서 바로 재생 (블로킹 함수이므로 이벤트 루프 밖에서 호출)
+    """
+    os.makedirs(mix_dir, exist_ok=True)
+    path = _mix_path(files, ratios, dir)
+    with _render_locks_lock:
+        lock = _render_locks.setdefault(path, threading.Lock())
+    with lock:
+        if os.path.exists(path):
+            os.utime(path)  # 캐시 최근 사용 표시
+            if preview:
+                play_audio_file(path)
+            return path
+        tracks, rate, channels, length = _load_tracks(files, ratios, dir)
+        track = engine.play_stream(os.path.basename(path), rate, channels, length) if preview else None
+        if track is not None:
+            out = track.pcm
+
+            def progress(frames):
+                track.available = frames
+        else:
+            out = np.empty((length, channels), dtype=np.int16)
+            progress = None
+        render_mix(tracks, out, progress)
+        _write_wav(path, out, rate, channels)
+        if preview and track is None:
+            play_audio_file(path)
+    with _render_locks_lock:
+        _render_locks.pop(path, None)
+    _prune_cache()
+    return path
+
+
+_live_dbfs = []  # 라이브 믹스 트랙별 dBFS (비율 -> 게인 변환용)
+
+
+def validate_ratio(ratio):
+    """믹스 비율은 0 ~ 1 (범위를 벗어나면 ValueError)"""
+    if not 0.0 <= float(ratio) <= 1.0:
+        raise ValueError(f"ratio must be between 0 and 1: {ratio}")
+
+
+def validate_mix(files: list, ratios: list):
+    """파일과 비율 목록 검사 (비어 있거나 길이가 다르거나 비율이 범위를 벗어나면 ValueError)"""
+    if not files:
+        raise ValueError("files must not be empty")
+    if len(files) != len(ratios):
+        raise ValueError(f"files and ratio lengths differ: {len(files)} != {len(ratios)}")
+    for ratio in ratios:
+        validate_ratio(ratio)
+
+
+def start_live_mix(files: list, ratios: list, dir="sounds"):
+    """files 를 반복 재생하며 출력 콜백에서 실시간으로 믹스 (mix_by_ratio 와 같은 비율 의미)"""
+    global _live_dbfs
+    validate_mix(files, ratios)
+    layers, dbfs = [], []
+    for file, ratio in zip(files, ratios):
+        pcm, rate, channels = sound_library.get(os.path.join(dir, file))
+        dbfs.append(pcm_dbfs(pcm))
+        layers.append((file, pcm, rate, channels, ratio_gain(dbfs[-1], ratio)))
+    _live_dbfs = dbfs
+    engine.play_live('live-mix', layers)
+    return engine.state()
+
+
+def set_live_ratio(index: int, ratio: float):
+    """라이브 믹스 트랙 비율 변경 (다음 출력 블록부터 부드럽게 반영)"""
+    validate_ratio(ratio)
+    if not 0 <= index < len(_live_dbfs):
+        return False
+    return engine.set_live_gain(index, ratio_gain(_live_dbfs[index], ratio))
 
 
 if __name__=="__main__":
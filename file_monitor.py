@@ -6,15 +6,23 @@ record_sounds 폴더 파일 변화 모니터링 스크립트
 import os
 import time
 import logging
+import io
+import hashlib
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait
 import random
 import configparser
 from datetime import datetime
 from pathlib import Path
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from collections import defaultdict
+from collections import OrderedDict, deque
 from supabase import create_client, Client
+from utils.encoder import encode_wav_file, read_wav
+from utils.metering import power_to_db
+from utils import http_client
+from utils.playback_control import send_command
 
 # 로깅 설정
 logging.basicConfig(
@@ -40,6 +48,200 @@ def load_config():
         logger.error(f"❌ 설정 파일을 찾을 수 없습니다: {config_file}")
         return None
 
+class AnalysisQueue:
+    """분석 업로드 작업 큐 (크기 제한, 동시 전송 수, 요청 마감 시간, 오버플로우 정책, 만료 재시도)"""
+    
+    OVERFLOW_POLICIES = ('drop_oldest', 'drop_quietest')
+    
+    def __init__(self, worker, max_size=8, num_workers=2, deadline=10.0, overflow_policy='drop_oldest',
+                 max_retries=1, on_discard=None):
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.worker = worker  # worker(item, timeout) - 전송 스레드에서 호출
+        self.on_discard = on_discard  # on_discard(item) - 분석하지 않고 버린 작업 (재시도 중 밀려나거나 재시도 한도 초과)
+        # 마감 시간을 넘긴 전송은 requests timeout 까지 스레드를 점유하므로 예비 스레드를 둠
+        self.max_uploads = num_workers * 2
+        self.executor = ThreadPoolExecutor(max_workers=self.max_uploads, thread_name_prefix="analysis-upload")
+        self.futures = set()  # 아직 끝나지 않은 전송 (마감 시간을 넘긴 것 포함)
+        self.max_size = max_size
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.overflow_policy = overflow_policy
+        self.items = deque()
+        self.cond = threading.Condition()
+        
+        # 통계
+        self.max_depth = 0
+        self.started = 0
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.expired = 0
+        self.retried = 0
+        self.total_wait = 0.0
+        
+        for i in range(num_workers):
+            threading.Thread(target=self._run, name=f"analysis-{i}", daemon=True).start()
+    
+    def submit(self, item, level=0.0):
+        """작업 추가 (큐가 가득 차면 정책에 따라 하나를 버림). 버려진 작업 반환"""
+        now = time.monotonic()
+        item = dict(item, level=level, enqueued=now, deadline=now + self.deadline)
+        dropped = None
+        with self.cond:
+            self.submitted += 1
+            if len(self.items) >= self.max_size:
+                if self.overflow_policy == 'drop_quietest':
+                    dropped = min(list(self.items) + [item], key=lambda x: x['level'])
+                    if dropped is not item:
+                        self.items.remove(dropped)
+                else:
+                    dropped = self.items.popleft()
+                self.dropped += 1
+            if dropped is not item:
+                self.items.append(item)
+                self.max_depth = max(self.max_depth, len(self.items))
+                self.cond.notify_all()
+        return dropped
+    
+    def _finished(self, future):
+        with self.cond:
+            self.futures.discard(future)
+            self.cond.notify_all()
+    
+    def _run(self):
+        while True:
+            with self.cond:
+                # 전송 스레드가 모두 사용 중이면 작업을 큐에 남겨 둠 (실행기 안에서 대기하다 만료되지 않도록)
+                while not self.items or len(self.futures) >= self.max_uploads:
+                    self.cond.wait()
+                item = self.items.popleft()
+                remaining = item['deadline'] - time.monotonic()
+                future = None
+                if remaining > 0:
+                    self.started += 1
+                    self.total_wait += time.monotonic() - item['enqueued']
+                    future = self.executor.submit(self.worker, item, remaining)
+                    self.futures.add(future)
+            try:
+                if future is not None:
+                    future.add_done_callback(self._finished)
+                    # requests 의 timeout 은 소켓 동작마다 적용되므로 전체 마감 시간은 여기서 기다림
+                    done, _ = wait([future], timeout=remaining)
+                    if done:
+                        future.result()
+                        with self.cond:
+                            self.completed += 1
+                        continue
+                self._expire(item)
+            except Exception as e:
+                logger.error(f"❌ 분석 작업 오류: {str(e)}")
+    
+    def _expire(self, item):
+        """마감 시간을 넘긴 작업을 재시도 한도까지 다시 큐에 넣음
+
+        늦게 끝난 이전 전송 결과는 워커가 item['expired'] 로 확인해 무시
+        """
+        item['expired'] = True
+        with self.cond:
+            self.expired += 1
+        retries = item.get('retries', 0)
+        name = os.path.basename(item['file_path'])
+        if retries < self.max_retries:
+            logger.warning(f"⏰ 마감 시간 초과, 분석 재시도 ({retries + 1}/{self.max_retries}): {name}")
+            with self.cond:
+                self.retried += 1
+            retry = {k: v for k, v in item.items() if k not in ('expired', 'level', 'enqueued', 'deadline')}
+            dropped = self.submit(dict(retry, retries=retries + 1), item['level'])
+        else:
+            logger.warning(f"⏰ 마감 시간 초과로 분석 생략: {name}")
+            dropped = item
+        if dropped is not None and self.on_discard is not None:
+            self.on_discard(dropped)
+    
+    def get_statistics(self):
+        """큐 깊이 및 처리 통계 반환"""
+        with self.cond:
+            return {
+                "depth": len(self.items),
+                "max_depth": self.max_depth,
+                "in_flight": len(self.futures),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "dropped": self.dropped,
+                "expired": self.expired,
+                "retried": self.retried,
+                "avg_wait": round(self.total_wait / self.started, 3) if self.started else 0.0
+            }
+
+class SoundSettingsCache:
+    """noise_level_settings 캐시 (TTL, updated_at 폴링으로 무효화, 실패 시 마지막 정상 설정 유지)"""
+    
+    def __init__(self, load_settings, load_version, sound_dir, ttl=300, poll_interval=30):
+        self.load_settings = load_settings  # 전체 설정 조회 (실패 시 None)
+        self.load_version = load_version  # 변경 감지용 버전 조회 (실패 시 None)
+        self.sound_dir = sound_dir
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        
+        self.settings = {}  # noise_level -> [{'sound_type', 'sound_files'}]
+        self.lookup = {}  # (noise_level, sound_type) -> [존재하는 음원 파일]
+        self.version = None
+        self.loaded_at = 0.0
+        
+        self.refresh()
+        threading.Thread(target=self._run, name="settings-cache", daemon=True).start()
+    
+    def refresh(self):
+        """DB에서 설정을 다시 읽어 조회 테이블 재구성 (실패 시 기존 설정 유지)"""
+        version = self.load_version()
+        sound_settings = self.load_settings()
+        if sound_settings is None:
+            logger.warning("⚠️ 음원 설정 갱신 실패 - 마지막 정상 설정을 계속 사용합니다")
+            return False
+        
+        lookup = {}
+        for noise_level, level_settings in sound_settings.items():
+            for setting in level_settings:
+                key = (noise_level, setting['sound_type'])
+                if key not in lookup:  # 같은 유형이 여러 개면 첫 설정 사용
+                    lookup[key] = [f for f in setting['sound_files']
+                                   if os.path.exists(os.path.join(self.sound_dir, f))]
+        
+        with self.lock:
+            self.settings = sound_settings
+            self.lookup = lookup
+            self.version = version
+            self.loaded_at = time.monotonic()
+        logger.info(f"✅ 음원 설정 캐시 갱신 ({len(sound_settings)}개 레벨, 버전: {version})")
+        return True
+    
+    def _run(self):
+        """TTL 만료 또는 updated_at 변경 시 백그라운드에서 갱신"""
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                if time.monotonic() - self.loaded_at >= self.ttl:
+                    self.refresh()
+                    continue
+                version = self.load_version()
+                if version is not None and version != self.version:
+                    logger.info("🔄 음원 설정 변경 감지")
+                    self.refresh()
+            except Exception as e:
+                logger.error(f"❌ 음원 설정 캐시 갱신 오류: {str(e)}")
+    
+    def get(self):
+        """캐시된 전체 설정"""
+        with self.lock:
+            return self.settings
+    
+    def files_for(self, noise_level, sound_type):
+        """해당 레벨/유형의 존재하는 음원 파일 목록 (설정이 없으면 None)"""
+        with self.lock:
+            return self.lookup.get((noise_level, sound_type))
+
 class RecordFileHandler(FileSystemEventHandler):
     """record_sounds 폴더의 파일 변화를 처리하는 핸들러"""
     
@@ -47,8 +249,9 @@ class RecordFileHandler(FileSystemEventHandler):
         self.watch_path = watch_path
         self.file_sizes = {}  # 파일 크기 추적
         self.file_timestamps = {}  # 파일 타임스탬프 추적
-        self.pending_changes = defaultdict(dict)  # 대기 중인 변화들
-        self.debounce_time = 0.5  # 디바운스 시간 (초)
+        self.analyzed_hashes = OrderedDict()  # 분석한 세그먼트 내용 해시 (최근 순)
+        self.max_ledger_size = 4096  # 해시 기록 최대 개수
+        self.ledger_lock = threading.Lock()
         self.api_url = "http://api-2424.bs-soft.co.kr/predict"
         self.app_server_url = "http://localhost"  # app.py 서버 URL
         self.sound_dir = "./sounds"  # ready 음원 폴더
@@ -56,6 +259,31 @@ class RecordFileHandler(FileSystemEventHandler):
         # 설정 파일 로드
         self.config = load_config()
         
+        # 분석 API 업로드 인코딩 (wav, flac, opus)
+        self.analysis_codec = 'wav'
+        self.opus_bitrate = '24k'
+        self.control_socket = '/tmp/smart-speaker.sock'  # app.py 재생 제어 채널
+        if self.config:
+            self.control_socket = self.config.get('speaker', 'control_socket', fallback=self.control_socket)
+            self.api_url = self.config.get('monitor', 'api_url', fallback=self.api_url)
+            self.analysis_codec = self.config.get('monitor', 'analysis_codec', fallback='wav')
+            self.opus_bitrate = self.config.get('files', 'opus_bitrate', fallback='24k')
+        
+        # 공유 HTTP 세션 (keep-alive 연결 풀 재사용)
+        http_client.configure(self.config)
+        self.http = http_client.get_sync_session()
+        
+        # 분석 업로드 큐 (옵저버 스레드를 막지 않도록 워커 스레드에서 전송)
+        monitor_config = self.config['monitor'] if self.config and 'monitor' in self.config else {}
+        self.analysis_queue = AnalysisQueue(
+            self._analyze,
+            max_size=int(monitor_config.get('queue_size', 8)),
+            num_workers=int(monitor_config.get('upload_workers', 2)),
+            deadline=float(monitor_config.get('request_deadline', 10)),
+            overflow_policy=monitor_config.get('overflow_policy', 'drop_oldest'),
+            max_retries=int(monitor_config.get('max_retries', 1)),
+            on_discard=self._forget)
+        
         # Supabase 설정 (환경변수 우선, 설정 파일 차선)
         self.supabase_url = os.getenv('SUPABASE_URL')
         self.supabase_key = os.getenv('SUPABASE_KEY')
@@ -76,8 +304,16 @@ class RecordFileHandler(FileSystemEventHandler):
         # Supabase 클라이언트 초기화
         self._init_supabase()
         
+        # 음원 설정 캐시 (감지 시점에는 DB를 조회하지 않음)
+        self.sound_settings = SoundSettingsCache(
+            self._load_sound_settings,
+            self._load_settings_version,
+            self.sound_dir,
+            ttl=int(monitor_config.get('settings_ttl', 300)),
+            poll_interval=int(monitor_config.get('settings_poll_interval', 30)))
+        
         logger.info(f"파일 모니터링 시작: {watch_path}")
-        logger.info(f"API 엔드포인트: {self.api_url}")
+        logger.info(f"API 엔드포인트: {self.api_url} (인코딩: {self.analysis_codec})")
         logger.info(f"앱 서버 URL: {self.app_server_url}")
         logger.info(f"Supabase URL: {self.supabase_url}")
     
@@ -92,14 +328,27 @@ class RecordFileHandler(FileSystemEventHandler):
         except Exception as e:
             logger.error(f"❌ Supabase 초기화 실패: {str(e)}")
     
+    def _load_settings_version(self):
+        """설정 변경 감지용 버전 (행 수, 최신 updated_at) 조회"""
+        try:
+            if not self.supabase:
+                return None
+            response = self.supabase.table('noise_level_settings').select('updated_at', count='exact') \
+                .order('updated_at', desc=True).limit(1).execute()
+            latest = response.data[0].get('updated_at') if response.data else None
+            return (response.count, latest)
+        except Exception as e:
+            logger.warning(f"⚠️ 음원 설정 버전 조회 실패: {str(e)}")
+            return None
+    
     def _load_sound_settings(self):
-        """Supabase에서 음원 설정 로드 (실시간)"""
+        """Supabase에서 음원 설정 로드 (실패 시 None)"""
         try:
             if not self.supabase:
                 logger.warning("⚠️ Supabase 클라이언트가 초기화되지 않았습니다")
-                return {}
+                return None
             
-            logger.debug("📋 Supabase에서 음원 설정 실시간 로드 중...")
+            logger.debug("📋 Supabase에서 음원 설정 로드 중...")
             
             # noise_level_settings 테이블에서 설정 가져오기
             response = self.supabase.table('noise_level_settings').select('*').execute()
@@ -123,7 +372,7 @@ class RecordFileHandler(FileSystemEventHandler):
                         })
                         logger.debug(f"   📊 {noise_level}: {sound_type} ({len(sound_files)}개 파일)")
                 
-                logger.debug(f"✅ 실시간 음원 설정 로드 완료 ({len(sound_settings)}개 레벨)")
+                logger.debug(f"✅ 음원 설정 로드 완료 ({len(sound_settings)}개 레벨)")
             else:
                 logger.warning("⚠️ Supabase에서 설정을 찾을 수 없습니다")
             
@@ -131,13 +380,12 @@ class RecordFileHandler(FileSystemEventHandler):
                 
         except Exception as e:
             logger.error(f"❌ 음원 설정 로드 실패: {str(e)}")
-            return {}
+            return None
     
     def get_sound_for_noise_level(self, noise_level, noise_type):
-        """소음 레벨에 따른 음원 선택 (실시간 DB 체크)"""
+        """소음 레벨에 따른 음원 선택 (캐시된 조회 테이블 사용)"""
         try:
-            # 매번 실시간으로 설정 로드
-            sound_settings = self._load_sound_settings()
+            sound_settings = self.sound_settings.get()
             
             if not sound_settings:
                 logger.warning("⚠️ 음원 설정이 없습니다. 재생하지 않습니다.")
@@ -148,39 +396,23 @@ class RecordFileHandler(FileSystemEventHandler):
                 logger.warning(f"⚠️ {noise_level} 레벨에 대한 설정이 없습니다. 재생하지 않습니다.")
                 return None
             
-            logger.info(f"🔍 음원 설정: {sound_settings}")
-            
-            # 해당 레벨의 모든 설정 가져오기
-            level_settings = sound_settings[noise_level]
-            
-            if not level_settings:
-                logger.warning(f"⚠️ {noise_level} 레벨에 설정된 음원이 없습니다. 재생하지 않습니다.")
-                return None
-            
-            # 여러 설정 중 sound_type이 noise_type과 일치하는 설정 선택
-            selected_setting = next((setting for setting in level_settings if setting['sound_type'] == noise_type), None)
+            # sound_type이 noise_type과 일치하는 설정의 (존재하는) 음원 목록
+            sound_files = self.sound_settings.files_for(noise_level, noise_type)
             
             # 일치하는 설정이 없는 경우 처리
-            if selected_setting is None:
+            if sound_files is None:
                 logger.warning(f"⚠️ {noise_level} 레벨에서 '{noise_type}' 유형의 설정을 찾을 수 없습니다.")
-                logger.info(f"   📋 사용 가능한 유형: {[setting['sound_type'] for setting in level_settings]}")
+                logger.info(f"   📋 사용 가능한 유형: {[setting['sound_type'] for setting in sound_settings[noise_level]]}")
                 return None
             
-            sound_files = selected_setting['sound_files']
-            
             if not sound_files:
-                logger.warning(f"⚠️ {noise_level} 레벨에 설정된 음원이 없습니다. 재생하지 않습니다.")
+                logger.warning(f"⚠️ {noise_level} 레벨에 설정된 음원 파일이 존재하지 않습니다. 재생하지 않습니다.")
                 return None
             
             # 설정된 음원 중에서 랜덤 선택
             selected_file = random.choice(sound_files)
             
-            # 파일이 실제로 존재하는지 확인
-            if not os.path.exists(os.path.join(self.sound_dir, selected_file)):
-                logger.warning(f"⚠️ 설정된 음원 파일이 존재하지 않습니다: {selected_file}. 재생하지 않습니다.")
-                return None
-            
-            logger.info(f"🎵 {noise_level} 레벨 음원 선택: {selected_file} ({selected_setting['sound_type']})")
+            logger.info(f"🎵 {noise_level} 레벨 음원 선택: {selected_file} ({noise_type})")
             return selected_file
             
         except Exception as e:
@@ -219,13 +451,24 @@ class RecordFileHandler(FileSystemEventHandler):
                 logger.warning("⚠️ 재생할 음원을 찾을 수 없습니다. 재생하지 않습니다.")
                 return False
             
-            # 먼저 기존 재생 정지
+            # 로컬 제어 채널로 정지+재생을 한 번에 요청하고 실제 재생 시작을 확인
+            try:
+                reply = send_command(self.control_socket, {"cmd": "play", "dir": "ready", "file": sound_file})
+                if reply.get("ok"):
+                    logger.info(f"✅ {noise_level} 레벨 음원 재생 성공: {sound_file}")
+                    return True
+                logger.warning(f"❌ {noise_level} 레벨 음원 재생 실패: {sound_file} ({reply.get('error')})")
+                return False
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ 제어 채널 사용 불가, HTTP로 재생 요청: {str(e)}")
+            
+            # HTTP 폴백: 먼저 기존 재생 정지
             stop_url = f"{self.app_server_url}/control/stop"
             logger.info(f"🛑 기존 재생 정지 요청")
             logger.info(f"   📡 URL: {stop_url}")
             
             try:
-                stop_response = requests.get(stop_url, timeout=5)
+                stop_response = self.http.get(stop_url, timeout=5)
                 if stop_response.status_code == 200:
                     logger.info("✅ 기존 재생 정지 성공")
                 else:
@@ -242,7 +485,7 @@ class RecordFileHandler(FileSystemEventHandler):
             logger.info(f"🔊 {noise_level} 레벨 음원 재생 시작: {sound_file}")
             logger.info(f"   📡 URL: {play_url}")
             
-            response = requests.get(play_url, timeout=10)
+            response = self.http.get(play_url, timeout=10)
             
             if response.status_code == 200:
                 logger.info(f"✅ {noise_level} 레벨 음원 재생 성공: {sound_file}")
@@ -261,7 +504,7 @@ class RecordFileHandler(FileSystemEventHandler):
             logger.error(f"❌ {noise_level} 레벨 음원 재생 오류: {str(e)}")
             return False
     
-    def send_file_to_api(self, file_path):
+    def send_file_to_api(self, file_path, timeout=30):
         """파일을 API로 전송하고 결과 반환"""
         try:
             if not os.path.exists(file_path):
@@ -271,31 +514,37 @@ class RecordFileHandler(FileSystemEventHandler):
             if file_size == 0:
                 return {"success": False, "error": "파일 크기가 0입니다"}
             
+            # 업로드 전 인코딩 (실패 시 원본 WAV 전송)
+            try:
+                upload_name, payload, content_type = encode_wav_file(file_path, self.analysis_codec, self.opus_bitrate)
+            except Exception as e:
+                logger.warning(f"⚠️ {self.analysis_codec} 인코딩 실패, WAV로 전송: {str(e)}")
+                upload_name, payload, content_type = encode_wav_file(file_path)
+            
             # 파일을 multipart/form-data로 전송
-            with open(file_path, 'rb') as f:
-                files = {'file': (os.path.basename(file_path), f, 'audio/wav')}
-                
-                logger.info(f"📤 API 전송 시작: {os.path.basename(file_path)} ({file_size:,} bytes)")
-                
-                response = requests.post(
-                    self.api_url,
-                    files=files,
-                    timeout=30  # 30초 타임아웃
-                )
+            files = {'file': (upload_name, payload, content_type)}
+            
+            logger.info(f"📤 API 전송 시작: {upload_name} ({file_size:,} → {len(payload):,} bytes)")
+            
+            response = self.http.post(
+                self.api_url,
+                files=files,
+                timeout=timeout  # 요청 마감 시간
+            )
+            
+            if response.status_code == 200:
+                try:
+                    result = response.json()
+                    logger.info(f"✅ API 응답 성공: {os.path.basename(file_path)}")
+                    return {"success": True, "result": result, "status_code": response.status_code}
+                except ValueError:
+                    # JSON이 아닌 경우 텍스트로 처리
+                    logger.info(f"✅ API 응답 성공 (텍스트): {os.path.basename(file_path)}")
+                    return {"success": True, "result": response.text, "status_code": response.status_code}
+            else:
+                logger.warning(f"❌ API 응답 실패: {os.path.basename(file_path)} (상태코드: {response.status_code})")
+                return {"success": False, "error": f"HTTP {response.status_code}", "status_code": response.status_code}
                 
-                if response.status_code == 200:
-                    try:
-                        result = response.json()
-                        logger.info(f"✅ API 응답 성공: {os.path.basename(file_path)}")
-                        return {"success": True, "result": result, "status_code": response.status_code}
-                    except ValueError:
-                        # JSON이 아닌 경우 텍스트로 처리
-                        logger.info(f"✅ API 응답 성공 (텍스트): {os.path.basename(file_path)}")
-                        return {"success": True, "result": response.text, "status_code": response.status_code}
-                else:
-                    logger.warning(f"❌ API 응답 실패: {os.path.basename(file_path)} (상태코드: {response.status_code})")
-                    return {"success": False, "error": f"HTTP {response.status_code}", "status_code": response.status_code}
-                    
         except requests.exceptions.Timeout:
             logger.error(f"⏰ API 전송 타임아웃: {os.path.basename(file_path)}")
             return {"success": False, "error": "타임아웃"}
@@ -320,14 +569,63 @@ class RecordFileHandler(FileSystemEventHandler):
             logger.info(f"   ⏰ 생성 시간: {file_time.strftime('%Y-%m-%d %H:%M:%S')}")
             logger.info("=" * 60)
             
-            # 파일 정보 추적에 추가
+            # 파일 정보 추적에 추가 (분석은 작성 완료(close) 또는 이름 변경 시점에 수행)
             self.file_sizes[file_path] = file_size
             self.file_timestamps[file_path] = file_time
-            
-            # API 전송 (새 파일 생성 시)
-            if file_size > 0:
-                api_result = self.send_file_to_api(file_path)
-                self._log_api_result(api_result, os.path.basename(file_path))
+    
+    def on_closed(self, event):
+        """쓰기 후 파일 닫힘 감지 (제자리에서 작성된 파일의 작성 완료 시점)"""
+        if not event.is_directory and event.src_path.endswith('.wav'):
+            self.analyze_once(event.src_path)
+    
+    def analyze_once(self, file_path):
+        """내용 해시 기록을 확인해 같은 세그먼트는 한 번만 분석"""
+        try:
+            with open(file_path, 'rb') as f:
+                content = f.read()
+        except OSError as e:
+            logger.warning(f"⚠️ 파일 읽기 실패: {os.path.basename(file_path)} - {str(e)}")
+            return
+        if not content:
+            return
+        
+        digest = hashlib.sha1(content).hexdigest()
+        with self.ledger_lock:
+            if digest in self.analyzed_hashes:
+                logger.info(f"⏭️ 이미 분석된 세그먼트입니다: {os.path.basename(file_path)}")
+                return
+            self.analyzed_hashes[digest] = file_path
+            if len(self.analyzed_hashes) > self.max_ledger_size:
+                self.analyzed_hashes.popitem(last=False)
+        
+        # 큐 오버플로우 정책(drop_quietest)을 위한 세그먼트 레벨 (dBFS)
+        try:
+            pcm, _, _ = read_wav(io.BytesIO(content))
+            samples = pcm.astype('float32')
+            level = float(power_to_db(samples.dot(samples) / max(len(samples), 1)))
+        except Exception:
+            level = 0.0
+        
+        dropped = self.analysis_queue.submit({'file_path': file_path, 'digest': digest}, level)
+        if dropped is not None:
+            logger.warning(f"🚫 분석 큐가 가득 차 세그먼트를 버립니다: {os.path.basename(dropped['file_path'])} ({dropped['level']:.1f} dBFS)")
+            self._forget(dropped)
+    
+    def _forget(self, item):
+        """분석하지 못한 세그먼트는 다음 완료 이벤트에서 다시 분석할 수 있도록 기록에서 제거"""
+        with self.ledger_lock:
+            self.analyzed_hashes.pop(item['digest'], None)
+    
+    def _analyze(self, item, timeout):
+        """분석 큐 워커: API 전송 후 결과 처리"""
+        file_path = item['file_path']
+        api_result = self.send_file_to_api(file_path, timeout=timeout)
+        if item.get('expired'):
+            # 마감 시간이 지난 결과로는 경고음을 재생하지 않음 (재시도와 기록 정리는 큐가 처리)
+            return
+        if not api_result["success"]:
+            self._forget(item)
+        self._log_api_result(api_result, os.path.basename(file_path))
     
     def on_modified(self, event):
         """파일 수정 감지"""
@@ -342,41 +640,19 @@ class RecordFileHandler(FileSystemEventHandler):
             size_change = current_size - previous_size
             
             if size_change != 0:  # 크기가 실제로 변경된 경우만 처리
-                # 변화 정보 저장
-                change_info = {
+                self._log_file_change({
                     'file_path': file_path,
                     'previous_size': previous_size,
                     'current_size': current_size,
                     'size_change': size_change,
                     'current_time': current_time,
-                    'previous_time': previous_time,
-                    'timestamp': time.time()
-                }
-                
-                # 대기 중인 변화 업데이트
-                self.pending_changes[file_path] = change_info
-                
-                # 디바운스 타이머 설정
-                self._schedule_change_log(file_path)
+                    'previous_time': previous_time
+                })
                 
                 # 파일 정보 추적 업데이트
                 self.file_sizes[file_path] = current_size
                 self.file_timestamps[file_path] = current_time
     
-    def _schedule_change_log(self, file_path):
-        """변화 로그 출력을 스케줄링"""
-        import threading
-        
-        def delayed_log():
-            time.sleep(self.debounce_time)
-            if file_path in self.pending_changes:
-                change_info = self.pending_changes.pop(file_path)
-                self._log_file_change(change_info)
-        
-        thread = threading.Timer(self.debounce_time, delayed_log)
-        thread.daemon = True
-        thread.start()
-    
     def _log_file_change(self, change_info):
         """파일 변화 로그 출력"""
         file_path = change_info['file_path']
@@ -409,12 +685,6 @@ class RecordFileHandler(FileSystemEventHandler):
                 logger.info(f"   ⏱️  마지막 수정 후: {time_diff:.1f}초")
         
         logger.info("-" * 50)
-        
-        # 파일이 완성되었을 때만 API 전송 (파일 작성 완료 또는 파일 확장으로 최종 크기에 도달)
-        if (change_type == "📝 [파일 작성 완료]" or 
-            (change_type == "📈 [파일 확장]")):  # 300KB 이상일 때
-            api_result = self.send_file_to_api(file_path)
-            self._log_api_result(api_result, os.path.basename(file_path))
     
     def _log_api_result(self, api_result, filename):
         """API 결과 로그 출력"""
@@ -443,8 +713,7 @@ class RecordFileHandler(FileSystemEventHandler):
                     logger.info(f"🚨 소음 감지! 레벨: {noise_level}, 유형: {noise_type}")
                     
                     # 설정값이 있는지 확인
-                    sound_settings = self._load_sound_settings()
-                    if noise_level in sound_settings:
+                    if noise_level in self.sound_settings.get():
                         logger.info("🎵 단계별 음원 재생 시작...")
                         self.play_warning_sound(filename, noise_level, noise_type)
                     else:
@@ -475,10 +744,6 @@ class RecordFileHandler(FileSystemEventHandler):
             file_path = event.src_path
             file_name = os.path.basename(file_path)
             
-            # 대기 중인 변화 제거
-            if file_path in self.pending_changes:
-                del self.pending_changes[file_path]
-            
             logger.info("=" * 60)
             logger.info(f"🗑️ [파일 삭제] {file_name}")
             logger.info(f"   📁 경로: {file_path}")
@@ -497,12 +762,6 @@ class RecordFileHandler(FileSystemEventHandler):
             old_name = os.path.basename(event.src_path)
             new_name = os.path.basename(event.dest_path)
             
-            # 대기 중인 변화 업데이트
-            if event.src_path in self.pending_changes:
-                change_info = self.pending_changes.pop(event.src_path)
-                change_info['file_path'] = event.dest_path
-                self.pending_changes[event.dest_path] = change_info
-            
             logger.info("=" * 60)
             logger.info(f"🔄 [파일 이동/이름 변경]")
             logger.info(f"   📁 이전 이름: {old_name}")
@@ -519,6 +778,10 @@ class RecordFileHandler(FileSystemEventHandler):
             if event.src_path in self.file_timestamps:
                 timestamp = self.file_timestamps.pop(event.src_path)
                 self.file_timestamps[event.dest_path] = timestamp
+            
+            # 임시 파일이 .wav 로 원자적 이름 변경된 경우 = 세그먼트 작성 완료
+            if event.dest_path.endswith('.wav'):
+                self.analyze_once(event.dest_path)
 
 def get_current_files(watch_path):
     """현재 폴더의 모든 WAV 파일 정보 출력"""
@@ -568,8 +831,7 @@ def main():
     print("   🗑️ 파일 삭제")
     print("   🔄 파일 이동/이름 변경")
     print("")
-    print("💡 연속 변화는 0.5초 후 마지막 변화만 출력됩니다")
-    print("🔍 파일 완성 시 API로 자동 전송 및 분석 결과 출력")
+    print("🔍 파일 완성(닫힘/이름 변경) 시 API로 한 번만 전송 및 분석 결과 출력")
     print("🚨 noise_level이 '경고'일 경우 랜덤 음원 자동 재생")
     print("=" * 60)
     
@@ -589,8 +851,15 @@ def main():
         logger.info("🚀 파일 모니터링이 시작되었습니다. Ctrl+C로 종료하세요.")
         print("📡 실시간 파일 변화 감지 중...")
         
+        elapsed = 0
         while True:
             time.sleep(1)
+            elapsed += 1
+            
+            # 분석 큐 통계 (1분마다)
+            if elapsed % 60 == 0:
+                logger.info(f"📊 분석 큐 상태: {event_handler.analysis_queue.get_statistics()}")
+                logger.info(f"📊 HTTP 연결 풀: {http_client.get_pool_statistics()['sync']}")
             
     except KeyboardInterrupt:
         logger.info("⏹️ 사용자에 의해 모니터링이 중단되었습니다.")
@@ -599,6 +868,7 @@ def main():
     finally:
         observer.stop()
         observer.join()
+        http_client.close_sync_session()
         logger.info("🏁 파일 모니터링이 종료되었습니다.")
 
 if __name__ == "__main__":
@@ -1,19 +1,25 @@
-import pyaudio, alsaaudio
-import os, subprocess
+import pyaudio
+import os, subprocess, math
 import asyncio
 from asyncio import sleep as asleep
-import aiohttp
-from time import time, sleep
-import threading
-from collections import deque
+from utils import http_client
+from utils.http_client import get_session
+from time import time, sleep, monotonic
 
 from utils.init import config, deviceId, print_settings, logger
 from utils import mute_alsa #mute_alsa removes many trivial warnings
-from utils.websocket_streaming import start_websocket_streaming, stream_audio_data
-from utils.audio_player import stop_current_playback, play_audio_file
+from utils.websocket_streaming import start_websocket_streaming, get_websocket_streamer
+from utils.audio_player import stop_current_playback, play_audio_file, handle_control_command
+from utils.playback_control import start_control_server
+from utils.volume import volume_controller
+from utils.recordings import recordings_index
+from utils.retention import retention_manager
+from utils.ring_buffer import AudioRingBuffer
+from utils.channels import select_chunk, DEFAULT_CHANNEL
+from utils.metering import SoundLevelMeter
+from utils.event_trigger import EventTrigger
+from utils.vad import StreamingVAD
 import wav_packaging
-if config.getboolean('options_using', 'record_speech_only'):
-    from bs_sound_utils.get_speech import get_speech_from_mic
 
 if config.get('audio', 'audio_card') == 'core_v2':
     from utils.user_button import button_run
@@ -22,15 +28,52 @@ else:
 
 nBundle = config.getint('files', 'num_sending_bundle')
 
+# Speech (VAD) or level/onset detector cutting segments out of the capture history
+gSegment_detector = None
+if config.getboolean('options_using', 'record_speech_only'):
+    gSegment_detector = StreamingVAD(config.getint('audio', 'rate'), channels=config.getint('audio', 'channels'),
+                                     margin_db=config.getfloat('vad', 'margin_db', fallback=9.0),
+                                     min_level_db=config.getfloat('vad', 'min_level_db', fallback=-55.0),
+                                     max_zcr=config.getfloat('vad', 'max_zcr', fallback=0.4),
+                                     pre_roll=config.getfloat('vad', 'pre_roll_seconds', fallback=0.3),
+                                     hangover=config.getfloat('vad', 'hangover_seconds', fallback=0.8),
+                                     max_speech=config.getfloat('vad', 'max_speech_seconds', fallback=30.0),
+                                     min_speech=config.getfloat('vad', 'min_speech_seconds', fallback=0.3))
+elif config.getboolean('options_using', 'event_trigger', fallback=False):
+    gSegment_detector = EventTrigger(config.getint('audio', 'rate'),
+                                  threshold_db=config.getfloat('trigger', 'threshold_db', fallback=-35.0),
+                                  onset_db=config.getfloat('trigger', 'onset_db', fallback=12.0),
+                                  pre_roll=config.getfloat('trigger', 'pre_roll_seconds', fallback=1.0),
+                                  post_roll=config.getfloat('trigger', 'post_roll_seconds', fallback=1.5),
+                                  max_event=config.getfloat('trigger', 'max_event_seconds', fallback=10.0))
+
 if not config.getboolean('options_using', 'send_recorded_file'):
     num_record_frames = config.getint('audio', 'num_frame')
 else:
     num_record_frames = config.getint('audio', 'num_frame')*nBundle
-gRecord_frames = [b'']*num_record_frames # Initialize num_record_frames length empty byte array
+if config.getboolean('options_using', 'gapless_snapshot', fallback=False):
+    # Gapless snapshots read from where the last one ended, so keep two periods of history
+    # to absorb the segment write time without overwriting unread frames
+    gapless_frames = math.ceil(2 * config.getint('files', 'record_seconds') * config.getint('audio', 'rate') / config.getint('audio', 'chunk'))
+    num_record_frames = max(num_record_frames, gapless_frames)
+if gSegment_detector is not None:
+    # Keep enough history for pre-roll + longest event + post-roll (plus one extra second)
+    trigger_frames = math.ceil((gSegment_detector.history_seconds() + 1) * config.getint('audio', 'rate') / config.getint('audio', 'chunk'))
+    num_record_frames = max(num_record_frames, trigger_frames)
+# Preallocated ring buffer holding num_record_frames chunks
+gRecord_buffer = AudioRingBuffer(num_record_frames*config.getint('audio', 'chunk'),
+                                 channels=config.getint('audio', 'channels'),
+                                 rate=config.getint('audio', 'rate'),
+                                 chunk=config.getint('audio', 'chunk'))
+
+# On-device sound level meter fed from the capture stream
+calibration_offset = config.get('metering', 'calibration_offset', fallback='')
+gSound_meter = SoundLevelMeter(config.getint('audio', 'rate'), config.getint('audio', 'chunk'),
+                               calibration_offset=float(calibration_offset) if calibration_offset else None)
 
 # WebSocket 스트리밍을 위한 전역 버퍼
-websocket_audio_buffer = deque(maxlen=100)  # 최대 100개 프레임 저장
-websocket_buffer_lock = threading.Lock()
+websocket_streamer = get_websocket_streamer() if config.getboolean('options_using', 'websocket_streaming') else None
+websocket_channel = config.get('websocket', 'channel', fallback=DEFAULT_CHANNEL)
 
 def check_audio_devices(p):
     for i in range(p.get_device_count()):
@@ -38,14 +81,8 @@ def check_audio_devices(p):
         print((i, dev['name'], dev['maxInputChannels']), dev['defaultSampleRate'])
 
 def initPyaudio() :
-    # Set Speaker Volume
-    m = alsaaudio.Mixer(control = config.get('audio', 'mixer_control'), cardindex = config.getint('audio', 'cardindex'))
-    new_volume = config.getint('speaker', 'volume')
-    for file in os.listdir('../'):
-        if file.endswith('.vol'):
-            new_volume = int(file.split('.')[0]) # Find previous volume
-    m.setvolume(new_volume) # Set the volume to custom value
-    # current_volume = m.getvolume() # Get the current Volume
+    # Set Speaker Volume (previous volume from the state file)
+    volume_controller.restore()
     # Initialize the PyAudio
     p = pyaudio.PyAudio()
     # check_audio_devices(p)
@@ -60,14 +97,27 @@ def initPyaudio() :
     return (stream, audioSampleSize)
 
 
+def capture_time(frame_count, time_info):
+    '''
+    Wall clock time of the first sample in the chunk, from the ADC time of PortAudio
+    '''
+    now = time()
+    adc_time = time_info.get('input_buffer_adc_time', 0)
+    if adc_time > 0:
+        return now - max(time_info['current_time'] - adc_time, 0)
+    # Some ALSA devices do not report the ADC time
+    return now - frame_count / gRecord_buffer.rate
+
 def record_callback(in_data, frame_count, time_info, status):
-    gRecord_frames.append(in_data)
-    del gRecord_frames[0]
+    gRecord_buffer.write(in_data, overflow=bool(status & pyaudio.paInputOverflow),
+                         capture_time=capture_time(frame_count, time_info))
+    level = gSound_meter.update(in_data)
+    if gSegment_detector is not None and level is not None:
+        gSegment_detector.feed(in_data, gRecord_buffer.total_frames, frame_count, level)
     
-    # WebSocket 스트리밍 - 스레드 안전한 버퍼링
-    if config.getboolean('options_using', 'websocket_streaming'):
-        with websocket_buffer_lock:
-            websocket_audio_buffer.append(in_data)
+    # WebSocket 스트리밍 - 이벤트 루프의 큐로 바로 전달
+    if websocket_streamer is not None:
+        websocket_streamer.feed(select_chunk(in_data, gRecord_buffer.channels, websocket_channel))
     
     return (in_data, pyaudio.paContinue)
 
@@ -75,38 +125,33 @@ def record_callback(in_data, frame_count, time_info, status):
 async def heartbeat():
     if config.getboolean('options_using', 'send_heartbeat'):
         while True:
-            async with aiohttp.ClientSession() as session:
-                try:
-                    await session.get('{}/{}/heartbeat'.format(config.get('device', 'heartbeat_url'), deviceId))
-                except Exception as e:
-                    logger.warning('Heartbeat - %s'%e)
+            try:
+                async with get_session().get('{}/{}/heartbeat'.format(config.get('device', 'heartbeat_url'), deviceId)):
+                    pass
+            except Exception as e:
+                logger.warning('Heartbeat - %s'%e)
 
             await asleep(config.getint('device', 'heartbeat_interval'))
 
 
-async def speech_stream(audioSampleSize):
-    nfile = 0
-    while(True):
-        if config.getint('files', 'num_file_save') != -1:
-            filename = os.path.join(config.get('files', 'record_dir'), f'{deviceId}-{nfile}.wav')
-        else:
-            filename = os.path.join(config.get('files', 'record_dir'), f'{int(time())}.wav')
-        audiodata = get_speech_from_mic()
-        wav_packaging.makeWavFile(filename, audioSampleSize, audiodata, dtype='int')
-        
-        # WebSocket 스트리밍 (음성 감지 모드에서도)
-        if config.getboolean('options_using', 'websocket_streaming'):
-            await stream_audio_data(audiodata)
-        
-        if config.getboolean('options_using', 'send_recorded_file'):
-            await wav_packaging.process(filename)
-        nfile += 1
-
 async def record_stream(stream, audioSampleSize):
     nfile = 0
     isSend = False
     count = 0
     send_recorded_file = config.getboolean('options_using', 'send_recorded_file')
+    gapless = config.getboolean('options_using', 'gapless_snapshot', fallback=False)
+    # Archive mode appends continuous segments to an hourly container (gapless snapshots only)
+    archive_mode = gapless and config.getboolean('options_using', 'archive_mode', fallback=False)
+    if not gapless and config.getboolean('options_using', 'archive_mode', fallback=False):
+        logger.warning('Archive mode needs gapless_snapshot = on - writing wav segments instead')
+    if archive_mode:
+        await asyncio.get_running_loop().run_in_executor(wav_packaging.segment_writer, wav_packaging.archive.recover)
+        if not config.getboolean('retention', 'enabled', fallback=False):
+            logger.warning('Archive mode without [retention] enabled - archive files are never deleted')
+    next_frame = None
+    lost_frames = 0
+    record_seconds = config.getint('files', 'record_seconds')
+    next_deadline = monotonic()
     while(True):
         try:
             # logger.debug(count)
@@ -120,22 +165,84 @@ async def record_stream(stream, audioSampleSize):
                 if nfile == config.getint('files', 'num_file_save') :
                     nfile = 0
                 filename = os.path.join(config.get('files', 'record_dir'), f'{deviceId}-{nfile}.wav')
-            # Record with non-blocking mode of pyaudio
-            stream.stop_stream()
-            if not send_recorded_file and count != 1:
-                wav_packaging.makeWavFile(filename, audioSampleSize, gRecord_frames)
-            elif isSend:
-                wav_packaging.makeWavFile(filename, audioSampleSize, gRecord_frames)
-                await wav_packaging.send_process(filename)
-            stream.start_stream()
+            if gapless:
+                # Copy the capture window while the stream keeps running
+                if not send_recorded_file:
+                    if next_frame is None:
+                        next_frame = gRecord_buffer.total_frames
+                    else:
+                        start, data = gRecord_buffer.snapshot(start_frame=next_frame)
+                        next_frame = gRecord_buffer.next_frame
+                        meta = gRecord_buffer.segment_info(start, len(data)//gRecord_buffer.channels)
+                        if archive_mode:
+                            await wav_packaging.appendArchiveAsync(data, meta)
+                        else:
+                            await wav_packaging.makeWavFileAsync(filename, audioSampleSize, data, dtype='array', meta=meta)
+                elif isSend:
+                    start, data = gRecord_buffer.snapshot()
+                    meta = gRecord_buffer.segment_info(start, len(data)//gRecord_buffer.channels)
+                    await wav_packaging.makeWavFileAsync(filename, audioSampleSize, data, dtype='array', meta=meta)
+                    await wav_packaging.send_process(filename)
+                if gRecord_buffer.lost_frames != lost_frames:
+                    logger.warning(f'Capture gap - {gRecord_buffer.lost_frames - lost_frames} frames lost')
+                    lost_frames = gRecord_buffer.lost_frames
+            else:
+                # Record with non-blocking mode of pyaudio
+                stream.stop_stream()
+                nframes = gRecord_buffer.available_frames()
+                meta = gRecord_buffer.segment_info(gRecord_buffer.total_frames - nframes, nframes)
+                if not send_recorded_file and count != 1:
+                    await wav_packaging.makeWavFileAsync(filename, audioSampleSize, gRecord_buffer.latest(), dtype='view', meta=meta)
+                elif isSend:
+                    await wav_packaging.makeWavFileAsync(filename, audioSampleSize, gRecord_buffer.latest(), dtype='view', meta=meta)
+                    await wav_packaging.send_process(filename)
+                stream.start_stream()
             # Record sound with duration of config.get('audio']['record_seconds']
-            await asleep(config.getint('files', 'record_seconds'))
+            if gapless:
+                # Fixed period on a monotonic deadline, so the write time does not stretch it
+                next_deadline += record_seconds
+                await asleep(max(next_deadline - monotonic(), 0))
+            else:
+                await asleep(record_seconds)
         except KeyboardInterrupt:
             stream.stop_stream()
             stream.close()
             quit()
 
+async def segment_stream(detector, audioSampleSize):
+    nfile = 0
+    segments = detector.attach(asyncio.get_running_loop())
+    send_recorded_file = config.getboolean('options_using', 'send_recorded_file')
+    while(True):
+        start_frame, end_frame, peak = await segments.get()
+        start, data = gRecord_buffer.snapshot(start_frame=start_frame, end_frame=end_frame)
+        if config.getint('files', 'num_file_save') == -1:
+            # Several events can close within one second, so the start sample keeps the names unique
+            filename = os.path.join(config.get('files', 'record_dir'), f'{int(time())}-{start}.wav')
+        else:
+            nfile += 1
+            if nfile == config.getint('files', 'num_file_save') :
+                nfile = 0
+            filename = os.path.join(config.get('files', 'record_dir'), f'{deviceId}-{nfile}.wav')
+        meta = gRecord_buffer.segment_info(start, len(data)//gRecord_buffer.channels)
+        meta.update(event=True, trigger=detector.kind, peak_level=round(peak, 2))
+        logger.info(f'{detector.kind.capitalize()} segment detected - {meta["duration"]:.1f}s, peak {peak:.1f} dBFS')
+        await wav_packaging.makeWavFileAsync(filename, audioSampleSize, data, dtype='array', meta=meta)
+        if send_recorded_file:
+            await wav_packaging.send_process(filename)
+
+def capture_stream(stream, audioSampleSize):
+    '''
+    Select the segment writer task for the configured recording mode
+    '''
+    if gSegment_detector is not None:
+        return segment_stream(gSegment_detector, audioSampleSize)
+    return record_stream(stream, audioSampleSize)
+
 async def coroutin_main(stream, audioSampleSize):
+    # 로컬 재생 제어 채널 시작
+    await start_control_server(config.get('speaker', 'control_socket', fallback='/tmp/smart-speaker.sock'), handle_control_command)
+    
     # WebSocket 스트리밍 태스크 시작
     websocket_task = None
     if config.getboolean('options_using', 'websocket_streaming'):
@@ -148,14 +255,12 @@ async def coroutin_main(stream, audioSampleSize):
     # 기존 태스크들과 함께 실행
     tasks = [button_run(), heartbeat()]
     
-    if config.getboolean('options_using', 'record_speech_only'):
-        tasks.append(speech_stream(audioSampleSize))
-    else:
-        tasks.append(record_stream(stream, audioSampleSize))
+    tasks.append(capture_stream(stream, audioSampleSize))
     
-    # WebSocket 스트리밍 처리 태스크 추가
-    if config.getboolean('options_using', 'websocket_streaming'):
-        tasks.append(websocket_streaming_task())
+    # 녹음 보관 정책
+    if config.getboolean('retention', 'enabled', fallback=False):
+        await asyncio.get_running_loop().run_in_executor(None, recordings_index.scan)
+        tasks.append(retention_manager.run())
     
     # WebSocket 태스크도 추가 (있는 경우)
     if websocket_task:
@@ -164,32 +269,6 @@ async def coroutin_main(stream, audioSampleSize):
     await asyncio.gather(*tasks)
 
 
-async def websocket_streaming_task():
-    """WebSocket 스트리밍 처리 태스크"""
-    if not config.getboolean('options_using', 'websocket_streaming'):
-        return
-        
-    logger.info("WebSocket 스트리밍 처리 태스크 시작")
-    
-    while True:
-        try:
-            # 버퍼에서 오디오 데이터 가져오기
-            audio_data = None
-            with websocket_buffer_lock:
-                if websocket_audio_buffer:
-                    audio_data = websocket_audio_buffer.popleft()
-            
-            if audio_data:
-                await stream_audio_data(audio_data)
-            
-            # 짧은 간격으로 체크
-            await asleep(0.01)  # 10ms
-            
-        except Exception as e:
-            logger.error(f"WebSocket 스트리밍 태스크 오류: {e}")
-            await asleep(1)
-
-
 def welcome_sound():
     play_audio_file(config.get('speaker', 'welcome_wav'))
 
@@ -217,6 +296,10 @@ if __name__ == '__main__':
 
     # Main loop
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(coroutin_main(stream, audioSampleSize))
-    loop.close()
+    try:
+        loop.run_until_complete(coroutin_main(stream, audioSampleSize))
+    finally:
+        volume_controller.flush()
+        loop.run_until_complete(http_client.close())
+        loop.close()
 
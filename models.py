@@ -2,4 +2,8 @@ from pydantic import BaseModel
 
 class Mixin(BaseModel):
     files: list = []
-    ratio: list = []
\ No newline at end of file
+    ratio: list = []
+
+class LiveRatio(BaseModel):
+    index: int
+    ratio: float
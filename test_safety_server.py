@@ -9,6 +9,7 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
 import uvicorn
 import time
+from utils.stream_codecs import CODECS, get_codec
 
 # FastAPI 앱 생성
 app = FastAPI(title="Safety Server Simulator")
@@ -44,6 +45,12 @@ async def root():
 @app.websocket("/ws/room/{room_name}/{sample_rate}/{dtype}/{device_id}")
 async def websocket_endpoint(websocket: WebSocket, room_name: str, sample_rate: int, dtype: str, device_id: str):
     await websocket.accept()
+    if dtype not in CODECS:
+        print(f"❌ 지원하지 않는 코덱: {dtype}")
+        await websocket.close(code=1003)
+        return
+    # dtype 경로 세그먼트로 협상된 코덱의 디코더
+    decoder = get_codec(dtype, sample_rate)
     print(f"✅ 클라이언트 연결: {device_id} -> 방: {room_name} (rate: {sample_rate}, type: {dtype})")
     
     # 클라이언트 등록
@@ -63,26 +70,30 @@ async def websocket_endpoint(websocket: WebSocket, room_name: str, sample_rate:
     rooms[room_name]["clients"].append(device_id)
     
     try:
-        frame_count = 0
+        message_count = 0
+        sample_count = 0
         bytes_received = 0
         start_time = time.time()
         
         while True:
-            # 클라이언트로부터 데이터 수신
+            # 클라이언트로부터 데이터 수신 (메시지 하나에 여러 프레임이 묶여 올 수 있음)
             data = await websocket.receive_bytes()
-            frame_count += 1
+            pcm = decoder.decode(data)  # int16 PCM
+            message_count += 1
+            sample_count += len(pcm) // 2
             bytes_received += len(data)
             
-            # 통계 출력 (100프레임마다)
-            if frame_count % 100 == 0:
+            # 통계 출력 (100메시지마다)
+            if message_count % 100 == 0:
                 elapsed = time.time() - start_time
-                duration = frame_count * 0.064  # 64ms per frame
-                rate = frame_count / elapsed if elapsed > 0 else 0
-                print(f"[{device_id}] 📊 프레임: {frame_count}, 데이터: {bytes_received/1024:.1f}KB, 속도: {rate:.1f}fps")
+                duration = sample_count / sample_rate  # 받은 오디오 길이
+                realtime = duration / elapsed if elapsed > 0 else 0
+                ratio = sample_count * 2 / bytes_received if bytes_received else 0
+                print(f"[{device_id}] 📊 메시지: {message_count}, 오디오: {duration:.1f}s, 데이터: {bytes_received/1024:.1f}KB ({dtype}, 압축 {ratio:.1f}x), 실시간 대비: {realtime:.2f}x")
             
-            # 에코백 (테스트용 - 10프레임마다)
-            if frame_count % 50 == 0:
-                await websocket.send_bytes(data)
+            # 에코백 (테스트용 - 50메시지마다)
+            if message_count % 50 == 0:
+                await websocket.send_bytes(pcm)
                 
     except WebSocketDisconnect:
         print(f"❌ 클라이언트 연결 종료: {device_id}")
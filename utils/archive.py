@@ -0,0 +1,196 @@
+"""
+연속 녹음 아카이브 모듈
+3초마다 작은 WAV 를 만드는 대신, 기간(기본 1시간)마다 미리 할당한 하나의 PCM 파일에
+세그먼트를 이어 쓰고 세그먼트 경계와 시각을 바이너리 인덱스(.idx)에 기록
+- 데이터를 먼저 쓰고 인덱스를 나중에 쓰므로 인덱스에 있는 구간은 항상 완전함
+- 임의 시간 구간을 WAV 로 추출 (세그먼트가 없는 구간은 무음)
+- 닫힌 파일은 utils.retention 의 보관 기간/용량 정책으로 오래된 것부터 삭제
+"""
+import glob
+import os
+import threading
+from datetime import datetime
+from time import time
+import numpy as np
+from utils.init import config, logger
+from utils.channels import output_channels, DEFAULT_CHANNEL
+from utils.encoder import encode_pcm
+
+# 인덱스 레코드: 데이터 파일 내 바이트 오프셋, 프레임 수, 누적 시작 샘플, 시작 시각 (epoch 초)
+INDEX_RECORD = np.dtype([('offset', '<u8'), ('frames', '<u4'), ('start_sample', '<u8'), ('start_time', '<f8')])
+
+
+class AudioArchive:
+    """기간별 PCM 컨테이너 파일과 탐색 인덱스"""
+
+    def __init__(self, archive_dir: str, rate: int, channels: int = 1, period: int = 3600,
+                 max_bytes: int = 0, preallocate: bool = True):
+        self.archive_dir = archive_dir
+        self.rate = rate
+        self.channels = channels
+        self.frame_bytes = 2 * channels
+        self.period = period  # 파일 하나가 담는 기간 (초)
+        self.max_bytes = max_bytes  # 0 보다 크면 이 크기에서도 새 파일 시작
+        self.preallocate = preallocate
+        self.lock = threading.Lock()
+        self.data_file = None
+        self.index_file = None
+        self.name = None
+        self.period_key = None
+        self.end = 0  # 현재 파일에 쓴 데이터 크기
+        self.segments = 0
+
+    def _paths(self, name):
+        base = os.path.join(self.archive_dir, name)
+        return base + '.pcm', base + '.idx'
+
+    def recover(self):
+        """비정상 종료로 남은 미리 할당 영역을 인덱스의 마지막 세그먼트 끝으로 잘라냄"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for index_path in glob.glob(os.path.join(self.archive_dir, '*.idx')):
+            data_path = index_path[:-4] + '.pcm'
+            records = np.fromfile(index_path, dtype=INDEX_RECORD)
+            end = int(records['offset'][-1] + records['frames'][-1] * self.frame_bytes) if len(records) else 0
+            if os.path.exists(data_path) and os.path.getsize(data_path) > end:
+                os.truncate(data_path, end)
+
+    def _open(self, start_time):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        name = datetime.fromtimestamp(start_time).strftime('%Y%m%d-%H%M%S')
+        self.name, n = name, 0
+        while os.path.exists(self._paths(self.name)[1]):
+            n += 1
+            self.name = f'{name}-{n}'
+        data_path, index_path = self._paths(self.name)
+        self.data_file = open(data_path, 'wb')
+        self.index_file = open(index_path, 'wb')
+        if self.preallocate:
+            size = self.period * self.rate * self.frame_bytes
+            if self.max_bytes:
+                size = min(size, self.max_bytes)
+            try:
+                # 연속된 블록을 한 번에 확보해 세그먼트마다 일어나는 메타데이터 갱신을 줄임
+                os.posix_fallocate(self.data_file.fileno(), 0, size)
+            except (AttributeError, OSError) as e:
+                logger.warning(f'Archive - preallocation failed: {e}')
+        self.period_key = int(start_time // self.period)
+        self.end = 0
+
+    def _close(self):
+        if self.data_file is not None:
+            self.data_file.truncate(self.end)  # 사용하지 않은 미리 할당 영역 반환
+            self.data_file.close()
+            self.index_file.close()
+            self.data_file = None
+            self.index_file = None
+
+    def append(self, samples, start_sample, start_time=None):
+        """int16 인터리브 샘플 세그먼트를 현재 아카이브 파일 끝에 추가"""
+        if start_time is None:
+            start_time = time() - len(samples) / self.channels / self.rate
+        samples = np.ascontiguousarray(samples, dtype=np.int16)
+        with self.lock:
+            if (self.data_file is None or int(start_time // self.period) != self.period_key
+                    or (self.max_bytes and self.end + samples.nbytes > self.max_bytes)):
+                self._close()
+                self._open(start_time)
+            self.data_file.seek(self.end)
+            self.data_file.write(samples)
+            self.data_file.flush()
+            record = np.array([(self.end, len(samples) // self.channels, start_sample, start_time)], dtype=INDEX_RECORD)
+            self.index_file.write(record.tobytes())
+            self.index_file.flush()
+            self.end += samples.nbytes
+            self.segments += 1
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def files(self, closed_only=False):
+        """아카이브 파일 목록 (이름, 크기, 세그먼트 수, 시작/끝 시각), 오래된 순
+
+        closed_only=True 이면 현재 쓰고 있는 파일은 제외
+        """
+        result = []
+        for index_path in sorted(glob.glob(os.path.join(self.archive_dir, '*.idx'))):
+            if closed_only and os.path.basename(index_path)[:-4] == self.name:
+                continue
+            records = np.fromfile(index_path, dtype=INDEX_RECORD)
+            if len(records) == 0:
+                continue
+            last = records[-1]
+            result.append({
+                "name": os.path.basename(index_path)[:-4],
+                "bytes": int(last['offset'] + last['frames'] * self.frame_bytes),
+                "segments": len(records),
+                "start_time": float(records['start_time'][0]),
+                "end_time": float(last['start_time'] + last['frames'] / self.rate),
+            })
+        return result
+
+    def total_bytes(self):
+        """아카이브 파일이 디스크에서 차지하는 크기 (현재 파일의 미리 할당 영역 포함)"""
+        total = 0
+        for path in glob.glob(os.path.join(self.archive_dir, '*.pcm')) + glob.glob(os.path.join(self.archive_dir, '*.idx')):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def remove(self, name):
+        """닫힌 아카이브 파일 삭제 후 줄어든 크기 반환 (현재 쓰고 있는 파일은 삭제하지 않음)"""
+        with self.lock:
+            if name == self.name and self.data_file is not None:
+                return 0
+        freed = 0
+        for path in self._paths(name):
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+        return freed
+
+    def extract(self, start_time, end_time):
+        """[start_time, end_time) 구간을 int16 인터리브 배열로 추출 (세그먼트가 없는 구간은 0)"""
+        nframes = max(int(round((end_time - start_time) * self.rate)), 0)
+        out = np.zeros(nframes * self.channels, dtype=np.int16)
+        for index_path in sorted(glob.glob(os.path.join(self.archive_dir, '*.idx'))):
+            records = np.fromfile(index_path, dtype=INDEX_RECORD)
+            if len(records) == 0:
+                continue
+            ends = records['start_time'] + records['frames'] / self.rate
+            records = records[(records['start_time'] < end_time) & (ends > start_time)]
+            if len(records) == 0:
+                continue
+            data = np.memmap(index_path[:-4] + '.pcm', dtype='<i2', mode='r')
+            for record in records:
+                dst = int(round((record['start_time'] - start_time) * self.rate))
+                src = max(-dst, 0)
+                dst = max(dst, 0)
+                count = min(int(record['frames']) - src, nframes - dst)
+                if count <= 0:
+                    continue
+                first = int(record['offset']) // 2 + src * self.channels
+                out[dst * self.channels:(dst + count) * self.channels] = data[first:first + count * self.channels]
+            del data
+        return out
+
+    def extract_wav(self, start_time, end_time):
+        """[start_time, end_time) 구간을 WAV bytes 로 추출"""
+        return encode_pcm(self.extract(start_time, end_time), self.rate, self.channels, 'wav')
+
+    def get_statistics(self):
+        return {"current": self.name, "bytes": self.end, "segments": self.segments}
+
+
+archive = AudioArchive(
+    config.get('archive', 'archive_dir', fallback='./archive'),
+    config.getint('audio', 'rate'),
+    output_channels(config.getint('audio', 'channels'), config.get('audio', 'record_channel', fallback=DEFAULT_CHANNEL)),
+    period=config.getint('archive', 'period', fallback=3600),
+    max_bytes=config.getint('archive', 'max_megabytes', fallback=0) * 1024 * 1024,
+    preallocate=config.getboolean('archive', 'preallocate', fallback=True))
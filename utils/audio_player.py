@@ -1,47 +1,66 @@
-import subprocess
-from utils.init import config
+import asyncio
+import os
+from utils.init import config, logger
+from utils.playback_engine import PlaybackEngine
+from utils.sound_library import SoundLibrary
 
-# 현재 재생 중인 프로세스를 추적하는 전역 변수
-current_playback_process = None
+# 메모리 매핑된 음원 캐시 (재생과 믹싱에서 공유)
+sound_library = SoundLibrary(config['files']['sound_dir'],
+                             max_bytes=config.getint('files', 'sound_cache_mb', fallback=64) * 1024 * 1024)
 
-def stop_current_playback():
-    """현재 재생 중인 음원을 정지합니다."""
-    global current_playback_process
-    
-    # 현재 재생 중인 프로세스가 있으면 정지
-    if current_playback_process is not None:
-        try:
-            current_playback_process.terminate()
-            current_playback_process.wait(timeout=1)
-        except subprocess.TimeoutExpired:
-            current_playback_process.kill()
-        except Exception as e:
-            print(f"프로세스 정지 중 오류: {e}")
-        finally:
-            current_playback_process = None
-    
-    # aplay 프로세스들도 강제 종료
+# 프로세스 전체에서 하나의 출력 스트림을 유지하는 재생 엔진
+engine = PlaybackEngine(rate=config.getint('speaker', 'play_rate', fallback=48000),
+                        channels=config.getint('speaker', 'play_channels', fallback=1),
+                        device_name=f"hw:{config['audio']['cardindex']},{config['audio']['deviceindex']}",
+                        fade=config.getfloat('speaker', 'fade', fallback=0.02),
+                        crossfade=config.getfloat('speaker', 'crossfade', fallback=0.2),
+                        smoothing=config.getfloat('speaker', 'live_smoothing', fallback=0.05))
+
+def stop_current_playback(fade_out=None):
+    """현재 재생 중인 음원을 정지합니다. fade_out=0 이면 즉시 정지"""
     try:
-        subprocess.run(['pkill', '-9', 'aplay'], check=False)
-        subprocess.run(['pkill', '-9', 'repeat_play'], check=False)
+        engine.stop(fade_out)
     except Exception as e:
-        print(f"aplay 프로세스 정지 중 오류: {e}")
+        print(f"재생 정지 중 오류: {e}")
+
+def play_audio_file(filename, loop=False, crossfade=None):
+    """음원 파일을 재생합니다. 기존 재생 중인 음원은 크로스페이드로 교체합니다. loop=True 이면 반복 재생
 
-def play_audio_file(filename):
-    """음원 파일을 재생합니다. 기존 재생 중인 음원은 정지합니다."""
-    global current_playback_process
-    
-    # 기존 재생 중인 음원 정지
-    stop_current_playback()
-    
-    # 새 음원 재생
+    재생 엔진의 트랙을 반환 (실패 시 None)
+    """
     try:
-        current_playback_process = subprocess.Popen([
-            'aplay', 
-            '-D', f"plughw:{config['audio']['cardindex']},{config['audio']['deviceindex']}", 
-            filename
-        ])
-        return current_playback_process
+        pcm, rate, channels = sound_library.get(filename)
+        return engine.play(os.path.basename(filename), pcm, rate, channels, loop=loop, crossfade=crossfade)
     except Exception as e:
         print(f"음원 재생 중 오류: {e}")
-        return None 
\ No newline at end of file
+        return None
+
+def get_playback_state():
+    """현재 재생 상태를 반환합니다."""
+    return engine.state()
+
+async def handle_control_command(command):
+    """로컬 제어 채널(utils.playback_control) 명령 처리"""
+    cmd = command.get('cmd')
+    if cmd == 'play':
+        directory = config['files']['sound_dir'] if command.get('dir', 'ready') == 'ready' else config['files']['record_dir']
+        filename = os.path.join(directory, os.path.basename(command['file']))
+        if not os.path.exists(filename):
+            return {"ok": False, "error": f"file not found: {command['file']}"}
+        # 기존 음원 정지와 새 음원 재생을 한 번에 처리
+        track = play_audio_file(filename, loop=command.get('loop', True))
+        if track is None:
+            return {"ok": False, "error": "playback did not start"}
+        # 엔진 콜백이 이 트랙의 첫 블록을 실제로 출력했을 때만 시작으로 응답
+        timeout = config.getfloat('speaker', 'control_ack_timeout', fallback=0.5)
+        rendered = await asyncio.get_running_loop().run_in_executor(None, track.rendered.wait, timeout)
+        if not rendered:
+            return {"ok": False, "error": f"playback not rendered within {timeout}s"}
+        logger.info(f'Control - play {command["file"]}')
+        return {"ok": True, "file": command['file'], "started_at": track.rendered_at}
+    if cmd == 'stop':
+        stop_current_playback()
+        return {"ok": True}
+    if cmd == 'status':
+        return {"ok": True, **get_playback_state()}
+    return {"ok": False, "error": f"unknown command: {cmd}"}
@@ -0,0 +1,37 @@
+"""
+다채널 캡처 오디오 채널 선택 모듈
+인터리브된 int16 샘플을 NumPy stride 로 분리하여 left/right/mid/both 중 하나로 변환
+"""
+import numpy as np
+
+CHANNEL_MODES = ('left', 'right', 'mid', 'both')
+DEFAULT_CHANNEL = 'mid'  # record_channel / websocket channel 설정이 없을 때
+
+
+def output_channels(channels, mode):
+    """채널 선택 후 출력 채널 수"""
+    if channels == 1 or mode == 'both':
+        return channels
+    return 1
+
+
+def select_channel(samples, channels, mode):
+    """인터리브 샘플 배열에서 mode 에 해당하는 채널 샘플 반환 (C-연속 배열)"""
+    if mode not in CHANNEL_MODES:
+        raise ValueError(f"Unknown channel mode: {mode}")
+    if output_channels(channels, mode) == channels:
+        return samples
+    frames = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+    if mode == 'left':
+        return np.ascontiguousarray(frames[:, 0])
+    if mode == 'right':
+        return np.ascontiguousarray(frames[:, 1])
+    # mid: 좌우 평균 다운믹스 (int32 로 더해 오버플로우 방지)
+    return ((frames[:, 0].astype(np.int32) + frames[:, 1]) >> 1).astype(np.int16)
+
+
+def select_chunk(in_data: bytes, channels, mode):
+    """콜백 청크(bytes)에서 채널 선택 후 bytes 로 반환"""
+    if output_channels(channels, mode) == channels:
+        return in_data
+    return select_channel(np.frombuffer(in_data, dtype=np.int16), channels, mode).tobytes()
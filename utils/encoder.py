@@ -0,0 +1,68 @@
+"""
+세그먼트 압축 인코딩 모듈
+업로드 전에 int16 PCM 을 무손실 FLAC 또는 지정 비트레이트의 Opus 로 인코딩
+(file_monitor 에서도 사용하므로 utils.init 에 의존하지 않음)
+"""
+import io
+import os
+import subprocess
+import wave
+import numpy as np
+
+try:
+    import soundfile as sf
+except ImportError:  # FLAC 인코딩에만 필요
+    sf = None
+
+CODECS = {
+    # codec: (content_type, 확장자)
+    'wav': ('audio/wav', '.wav'),
+    'flac': ('audio/flac', '.flac'),
+    'opus': ('audio/ogg; codecs=opus', '.opus'),
+}
+
+
+def read_wav(filename):
+    """WAV 파일을 (int16 PCM 배열, 샘플레이트, 채널 수)로 읽기"""
+    with wave.open(filename, 'rb') as wf:
+        rate = wf.getframerate()
+        channels = wf.getnchannels()
+        pcm = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+    return pcm, rate, channels
+
+
+def encode_pcm(pcm, rate, channels, codec='wav', bitrate='24k'):
+    """int16 PCM 을 codec 으로 인코딩해 bytes 로 반환"""
+    if codec == 'wav':
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as wf:
+            wf.setnchannels(channels)
+            wf.setsampwidth(2)
+            wf.setframerate(rate)
+            wf.writeframes(pcm)
+        return buf.getvalue()
+    if codec == 'flac':
+        if sf is None:
+            raise RuntimeError("FLAC encoding requires the soundfile package")
+        buf = io.BytesIO()
+        sf.write(buf, pcm.reshape(-1, channels), rate, format='FLAC', subtype='PCM_16')
+        return buf.getvalue()
+    if codec == 'opus':
+        result = subprocess.run(['ffmpeg', '-loglevel', 'error', '-f', 's16le', '-ar', str(rate), '-ac', str(channels),
+                                 '-i', 'pipe:0', '-c:a', 'libopus', '-b:a', str(bitrate), '-f', 'ogg', 'pipe:1'],
+                                input=pcm.tobytes(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        return result.stdout
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def encode_wav_file(filename, codec='wav', bitrate='24k'):
+    """WAV 파일을 인코딩해 (업로드 파일명, bytes, content_type) 반환"""
+    if codec == 'wav':
+        with open(filename, 'rb') as f:
+            data = f.read()
+    else:
+        pcm, rate, channels = read_wav(filename)
+        data = encode_pcm(pcm, rate, channels, codec, bitrate)
+    content_type, ext = CODECS[codec]
+    name = os.path.splitext(os.path.basename(filename))[0] + ext
+    return name, data, content_type
@@ -0,0 +1,86 @@
+"""
+이벤트 트리거 세그먼트 모듈
+청크 레벨이 임계값을 넘거나 배경 소음 대비 급격히 커지면(온셋) 이벤트로 판단하고,
+pre-roll + 이벤트 + post-roll 구간을 asyncio 큐로 전달
+"""
+import asyncio
+
+
+class EventTrigger:
+    """레벨/온셋 기반 이벤트 구간 검출기 (record_callback 스레드에서 feed 호출)"""
+    kind = 'level'
+
+    def __init__(self, rate: int, threshold_db: float = -35.0, onset_db: float = 12.0,
+                 pre_roll: float = 1.0, post_roll: float = 1.5, max_event: float = 10.0,
+                 min_event: float = 0.0, floor_seconds: float = 10.0):
+        self.rate = rate
+        self.threshold_db = threshold_db  # 절대 레벨 임계값 (dBFS)
+        self.onset_db = onset_db  # 배경 소음 대비 상승 임계값 (dB)
+        self.pre_roll_frames = int(pre_roll * rate)
+        self.post_roll_frames = int(post_roll * rate)
+        self.max_event_frames = int(max_event * rate)
+        self.min_event_frames = int(min_event * rate)  # 이보다 짧은 이벤트는 버림
+        self.floor_seconds = floor_seconds
+
+        self.noise_floor = None  # 이벤트가 없을 때 추적하는 배경 소음 레벨
+        self.active = False
+        self.segment_start = 0  # pre-roll 을 포함한 현재 세그먼트 시작 프레임
+        self.last_active = 0
+        self.active_frames = 0
+        self.peak_db = None
+        self.events = 0
+
+        self.loop = None
+        self.queue = None
+
+    def history_seconds(self):
+        """세그먼트 하나를 잘라내기 위해 캡처 버퍼가 유지해야 하는 길이"""
+        return (self.pre_roll_frames + self.max_event_frames + self.post_roll_frames) / self.rate
+
+    def attach(self, loop):
+        """이벤트 구간을 받을 asyncio 큐 생성"""
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        return self.queue
+
+    def track_floor(self, level_db, nframes):
+        """이벤트가 없는 구간의 레벨로 배경 소음 레벨 갱신 (하강은 즉시, 상승은 천천히)"""
+        if self.noise_floor is None or level_db < self.noise_floor:
+            self.noise_floor = level_db
+        else:
+            alpha = min(nframes / (self.rate * self.floor_seconds), 1.0)
+            self.noise_floor += alpha * (level_db - self.noise_floor)
+
+    def is_active(self, in_data, level_db, nframes):
+        """청크가 이벤트에 해당하는지 판단"""
+        onset = self.noise_floor is not None and level_db - self.noise_floor >= self.onset_db
+        triggered = level_db >= self.threshold_db or onset
+        if not triggered and not self.active:
+            self.track_floor(level_db, nframes)
+        return triggered
+
+    def feed(self, in_data, end_frame, nframes, level_db):
+        """콜백 청크 [end_frame - nframes, end_frame) 로 이벤트 상태 갱신"""
+        if self.is_active(in_data, level_db, nframes):
+            if not self.active:
+                self.active = True
+                self.segment_start = max(end_frame - nframes - self.pre_roll_frames, 0)
+                self.active_frames = 0
+                self.peak_db = level_db
+            self.last_active = end_frame
+            self.active_frames += nframes
+            self.peak_db = max(self.peak_db, level_db)
+        elif self.active and end_frame - self.last_active >= self.post_roll_frames:
+            if self.active_frames >= self.min_event_frames:
+                self._emit(self.segment_start, self.last_active + self.post_roll_frames)
+            self.active = False
+            return
+        if self.active and end_frame - self.segment_start >= self.pre_roll_frames + self.max_event_frames:
+            # 긴 이벤트는 max_event 단위로 나누어 연속 세그먼트로 전달
+            self._emit(self.segment_start, end_frame)
+            self.segment_start = end_frame
+
+    def _emit(self, start_frame, end_frame):
+        self.events += 1
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, (start_frame, end_frame, self.peak_db))
@@ -1,12 +1,3 @@
-from pathlib import Path
-import os
-
-def create_vol_file(value):
-    for file in os.listdir('../'):
-        if file.endswith('.vol'):
-            os.remove(f'../{file}')
-    Path(f"../{value}.vol").touch()
-
 def change_audio_order(audio_list):
     if "새소리9.wav" in audio_list and "새소리10.wav" in audio_list:
         index_9 = audio_list.index("새소리9.wav")
@@ -0,0 +1,116 @@
+"""
+공유 HTTP 클라이언트 모듈
+프로세스 전체에서 하나의 연결 풀(keep-alive, DNS 캐시, 호스트별 연결 수 제한)을 재사용
+- 비동기 코드: get_session() (aiohttp)
+- 동기 코드: get_sync_session() (requests, DNS 캐시 없이 시스템 리졸버 사용)
+- 종료 시 close() / close_sync_session() 으로 연결 풀 정리
+(file_monitor 에서도 사용하므로 utils.init 에 의존하지 않음)
+"""
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # file_monitor 처럼 동기 클라이언트만 쓰는 경우
+    aiohttp = None
+
+settings = {
+    "limit": 10,  # 전체 동시 연결 수
+    "limit_per_host": 4,  # 호스트별 동시 연결 수
+    "dns_ttl": 300,  # DNS 캐시 유지 시간 (초)
+    "keepalive_timeout": 30,  # 유휴 연결 유지 시간 (초)
+}
+
+_session = None
+_sync_session = None
+_stats = {
+    "requests": 0,
+    "connections_created": 0,
+    "connections_reused": 0,
+    "dns_cache_hits": 0,
+    "dns_cache_misses": 0,
+}
+
+
+def configure(config):
+    """config 의 [http] 섹션으로 연결 풀 설정 (세션 생성 전에 호출)"""
+    if config is None or not config.has_section('http'):
+        return
+    for key in ("limit", "limit_per_host", "dns_ttl", "keepalive_timeout"):
+        settings[key] = config.getint('http', key, fallback=settings[key])
+
+
+def _counter(name):
+    async def on_event(session, context, params):
+        _stats[name] += 1
+    return on_event
+
+
+def get_session():
+    """공유 aiohttp 세션 반환 (이벤트 루프 안에서 호출)"""
+    global _session
+    if _session is None or _session.closed:
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(_counter("requests"))
+        trace.on_connection_create_end.append(_counter("connections_created"))
+        trace.on_connection_reuseconn.append(_counter("connections_reused"))
+        trace.on_dns_cache_hit.append(_counter("dns_cache_hits"))
+        trace.on_dns_cache_miss.append(_counter("dns_cache_misses"))
+        connector = aiohttp.TCPConnector(limit=settings["limit"],
+                                         limit_per_host=settings["limit_per_host"],
+                                         ttl_dns_cache=settings["dns_ttl"],
+                                         keepalive_timeout=settings["keepalive_timeout"])
+        _session = aiohttp.ClientSession(connector=connector, trace_configs=[trace])
+    return _session
+
+
+def get_sync_session():
+    """공유 requests 세션 반환 (스레드에서 함께 사용)"""
+    global _sync_session
+    if _sync_session is None:
+        adapter = HTTPAdapter(pool_connections=settings["limit"], pool_maxsize=settings["limit_per_host"])
+        _sync_session = requests.Session()
+        _sync_session.mount('http://', adapter)
+        _sync_session.mount('https://', adapter)
+    return _sync_session
+
+
+def close_sync_session():
+    """공유 requests 세션 종료"""
+    global _sync_session
+    if _sync_session is not None:
+        _sync_session.close()
+        _sync_session = None
+
+
+async def close():
+    """공유 aiohttp/requests 세션 종료 (프로세스 종료 시 이벤트 루프 안에서 호출)"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    close_sync_session()
+
+
+def get_pool_statistics():
+    """연결 재사용 확인용 풀 통계 반환"""
+    pools = []
+    if _sync_session is not None:
+        seen = set()
+        for adapter in _sync_session.adapters.values():
+            if id(adapter) in seen:
+                continue
+            seen.add(id(adapter))
+            manager = adapter.poolmanager
+            for key in manager.pools.keys():
+                pool = manager.pools[key]
+                pools.append({
+                    "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                    "connections_created": pool.num_connections,
+                    "requests": pool.num_requests,
+                })
+    return {
+        "settings": dict(settings),
+        "async": dict(_stats, open=_session is not None and not _session.closed),
+        "sync": pools,
+    }
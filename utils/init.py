@@ -1,5 +1,6 @@
 import configparser, math, os, subprocess
 from utils.setLogger import Logger
+from utils import http_client
 from time import time
 import alsaaudio
 
@@ -74,3 +75,5 @@ config.set('files', 'num_sending_bundle', str(int(num_sending_bundle)))
 # Set logger
 logger = Logger(name=config['device']['name'], logdir=config['files']['log_dir'], level=config['files']['log_level'])
 
+# Set shared HTTP connection pool limits
+http_client.configure(config)
@@ -0,0 +1,94 @@
+"""
+실시간 소음 측정 모듈
+record_callback 청크마다 평균 제곱값을 계산해 두고, 요청 시 1초/1분/15분 구간의
+RMS, dBFS, Leq, Lmax, 백분위 레벨(L10/L90)을 벡터 연산으로 계산
+"""
+import threading
+import numpy as np
+
+FULL_SCALE = 32768.0
+MIN_POWER = 1e-10  # log10(0) 방지용 최소 파워 (-100 dBFS)
+WINDOWS = {"1s": 1, "1min": 60, "15min": 900}
+
+
+def power_to_db(power):
+    """풀스케일 기준 파워(평균 제곱)를 dB 로 변환"""
+    return 10 * np.log10(np.maximum(power / FULL_SCALE**2, MIN_POWER))
+
+
+class SoundLevelMeter:
+    """청크 단위 레벨 히스토리를 유지하는 소음 측정기"""
+
+    def __init__(self, rate: int, chunk: int, history_seconds: int = 900, calibration_offset=None):
+        self.rate = rate
+        self.chunk = chunk
+        self.calibration_offset = calibration_offset  # dBFS -> dB SPL 보정값 (None 이면 dBFS)
+        num_chunks = -(-history_seconds * rate // chunk) + 1
+        self.chunk_power = np.zeros(num_chunks, dtype=np.float64)  # 청크 평균 제곱
+        self.chunk_peak = np.zeros(num_chunks, dtype=np.int32)  # 청크 최대 절대값
+        self.pos = 0
+        self.count = 0  # 기록된 청크 수 (최대 num_chunks)
+        self.lock = threading.Lock()
+
+    def update(self, in_data: bytes):
+        """콜백 청크 하나의 파워와 피크를 기록하고 청크 레벨(dBFS) 반환"""
+        samples = np.frombuffer(in_data, dtype=np.int16).astype(np.float32)
+        if len(samples) == 0:
+            return None
+        power = float(np.dot(samples, samples)) / len(samples)
+        peak = int(np.abs(samples).max())
+        with self.lock:
+            self.chunk_power[self.pos] = power
+            self.chunk_peak[self.pos] = peak
+            self.pos = (self.pos + 1) % len(self.chunk_power)
+            self.count = min(self.count + 1, len(self.chunk_power))
+        return float(power_to_db(power))
+
+    def _recent(self, nchunks):
+        """최근 nchunks 개 청크의 (파워, 피크) 배열 복사본"""
+        with self.lock:
+            nchunks = min(nchunks, self.count)
+            idx = (self.pos - nchunks + np.arange(nchunks)) % len(self.chunk_power)
+            return self.chunk_power[idx], self.chunk_peak[idx]
+
+    def _offset(self):
+        return self.calibration_offset if self.calibration_offset is not None else 0.0
+
+    def current_level(self):
+        """가장 최근 청크의 레벨 (dB)"""
+        power, _ = self._recent(1)
+        if len(power) == 0:
+            return None
+        return float(power_to_db(power[0])) + self._offset()
+
+    def levels(self, seconds):
+        """최근 seconds 초 구간의 레벨 통계"""
+        power, peak = self._recent(max(int(round(seconds * self.rate / self.chunk)), 1))
+        if len(power) == 0:
+            return None
+        offset = self._offset()
+        mean_power = float(power.mean())
+        chunk_levels = power_to_db(power) + offset
+        # L10: 10% 시간 동안 초과한 레벨, L90: 90% 시간 동안 초과한 레벨
+        l10, l90 = np.percentile(chunk_levels, [90, 10])
+        return {
+            "seconds": len(power) * self.chunk / self.rate,
+            "rms": round(float(np.sqrt(mean_power)) / FULL_SCALE, 6),
+            "dbfs": round(float(power_to_db(mean_power)), 2),
+            "leq": round(float(power_to_db(mean_power)) + offset, 2),
+            "lmax": round(float(chunk_levels.max()), 2),
+            "lmin": round(float(chunk_levels.min()), 2),
+            "l10": round(float(l10), 2),
+            "l90": round(float(l90), 2),
+            "peak_dbfs": round(float(20 * np.log10(max(peak.max(), 1) / FULL_SCALE)), 2)
+        }
+
+    def get_statistics(self):
+        """1초/1분/15분 구간 레벨 통계 반환"""
+        current = self.current_level()
+        return {
+            "unit": "dB SPL" if self.calibration_offset is not None else "dBFS",
+            "calibration_offset": self.calibration_offset,
+            "current": round(current, 2) if current is not None else None,
+            **{name: self.levels(seconds) for name, seconds in WINDOWS.items()}
+        }
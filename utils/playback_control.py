@@ -0,0 +1,50 @@
+"""
+로컬 재생 제어 채널 모듈
+Unix 소켓으로 JSON 한 줄 명령을 주고받아, 다른 프로세스(file_monitor)가 HTTP 요청 없이
+재생을 한 번에 전환하고 실제 재생 시작 여부를 확인할 수 있도록 함
+(file_monitor 에서도 사용하므로 utils.init 에 의존하지 않음)
+"""
+import asyncio
+import inspect
+import json
+import os
+import socket
+
+
+async def start_control_server(path, handle):
+    """제어 서버 시작. handle(command: dict) -> dict (또는 코루틴) 는 이벤트 루프 스레드에서 호출됨"""
+    async def on_client(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = handle(json.loads(line))
+                    if inspect.isawaitable(reply):
+                        reply = await reply
+                except Exception as e:
+                    reply = {"ok": False, "error": str(e)}
+                writer.write((json.dumps(reply, ensure_ascii=False) + '\n').encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.remove(path)  # 이전 실행에서 남은 소켓 파일
+    return await asyncio.start_unix_server(on_client, path=path)
+
+
+def send_command(path, command, timeout=2.0):
+    """제어 명령 전송 후 응답 반환 (소켓이 없으면 OSError)"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((json.dumps(command, ensure_ascii=False) + '\n').encode())
+        reply = b''
+        while not reply.endswith(b'\n'):
+            data = sock.recv(4096)
+            if not data:
+                break
+            reply += data
+    return json.loads(reply)
@@ -0,0 +1,286 @@
+"""
+상시 재생 엔진 모듈
+한 번 연 PyAudio 출력 스트림에 미리 읽어둔 PCM 을 콜백으로 공급
+- 장치를 다시 열지 않는 끊김 없는 반복 재생
+- 즉시 정지, 짧은 페이드 인/아웃, 트랙 간 크로스페이드
+- 현재 재생 상태 조회
+"""
+import threading
+from time import time
+import numpy as np
+
+try:
+    import pyaudio
+except ImportError:  # 출력 장치가 없는 환경
+    pyaudio = None
+
+
+class _Track:
+    """재생 중인 PCM 하나와 게인 엔벨로프"""
+
+    def __init__(self, name, pcm, loop, gain, target, step):
+        self.name = name
+        self.pcm = pcm  # (프레임, 채널) int16
+        self.pos = 0
+        self.loop = loop
+        self.gain = gain
+        self.target = target
+        self.step = step  # 프레임당 게인 변화량
+        self.started_at = time()
+        self.loops = 0
+        self.available = len(pcm)  # 재생 가능한 프레임 수 (스트림 트랙은 렌더링에 따라 증가)
+        self.rendered = threading.Event()  # 콜백이 첫 블록을 출력하면 설정
+        self.rendered_at = None
+
+    def ramp_to(self, target, frames):
+        self.target = target
+        self.step = abs(target - self.gain) / frames if frames > 0 else float('inf')
+        if frames <= 0:
+            self.gain = target
+
+    def envelope(self, n):
+        """다음 n 프레임의 게인 배열"""
+        if self.gain == self.target or n == 0:
+            return None
+        direction = 1.0 if self.target > self.gain else -1.0
+        env = self.gain + direction * self.step * np.arange(1, n + 1, dtype=np.float32)
+        env = np.minimum(env, self.target) if direction > 0 else np.maximum(env, self.target)
+        self.gain = float(env[-1])
+        return env
+
+    def read(self, n):
+        """다음 n 프레임 (반복 재생이면 처음으로 이어 붙임), 끝나면 짧은 배열 반환"""
+        total = len(self.pcm)
+        if not self.loop:
+            out = self.pcm[self.pos:min(self.pos + n, self.available)]
+            self.pos += len(out)
+            return out
+        idx = (self.pos + np.arange(n)) % total
+        self.loops += (self.pos + n) // total
+        self.pos = (self.pos + n) % total
+        return self.pcm[idx]
+
+    @property
+    def finished(self):
+        return (not self.loop and self.pos >= len(self.pcm)) or (self.target == 0.0 and self.gain == 0.0)
+
+
+class _LiveMix:
+    """여러 반복 트랙을 콜백 블록마다 섞는 라이브 믹스 (트랙별 게인은 부드럽게 변경)"""
+    loop = True
+
+    def __init__(self, name, layers, channels, smoothing_frames):
+        self.name = name
+        self.layers = layers  # _Track 목록 (gain/target 이 트랙별 게인)
+        self.channels = channels
+        self.smoothing_frames = smoothing_frames
+        self.gain = 0.0
+        self.target = 1.0
+        self.step = 0.0
+        self.started_at = time()
+        self.rendered = threading.Event()
+        self.rendered_at = None
+
+    ramp_to = _Track.ramp_to
+    envelope = _Track.envelope
+
+    # 상태 조회는 첫 트랙 기준 (트랙이 없으면 빈 값)
+    pcm = property(lambda self: self.layers[0].pcm if self.layers else np.zeros((0, self.channels), dtype=np.int16))
+    pos = property(lambda self: self.layers[0].pos if self.layers else 0)
+    loops = property(lambda self: self.layers[0].loops if self.layers else 0)
+
+    def set_gain(self, index, gain, smoothing_frames=None):
+        """다음 콜백 블록부터 smoothing_frames 동안 게인 변경 (클릭 방지)"""
+        frames = self.smoothing_frames if smoothing_frames is None else smoothing_frames
+        self.layers[index].ramp_to(max(float(gain), 0.0), frames)
+
+    def read(self, n):
+        out = np.zeros((n, self.channels), dtype=np.float32)
+        for layer in self.layers:
+            frames = layer.read(n)
+            env = layer.envelope(len(frames))
+            if env is None:
+                if layer.gain:
+                    out += frames * np.float32(layer.gain)
+            else:
+                out += frames * env[:, None]
+        return out
+
+    @property
+    def finished(self):
+        return self.target == 0.0 and self.gain == 0.0
+
+    def layer_state(self):
+        return [{"name": l.name, "gain": round(l.gain, 4), "target": round(l.target, 4)} for l in self.layers]
+
+
+def resample(pcm, src_rate, dst_rate):
+    """선형 보간 리샘플링 ((프레임, 채널) int16)"""
+    if src_rate == dst_rate or len(pcm) == 0:
+        return pcm
+    n = int(round(len(pcm) * dst_rate / src_rate))
+    x = np.arange(n) * (src_rate / dst_rate)
+    xp = np.arange(len(pcm))
+    out = np.stack([np.interp(x, xp, pcm[:, c]) for c in range(pcm.shape[1])], axis=1)
+    return out.astype(np.int16)
+
+
+class PlaybackEngine:
+    """출력 스트림을 계속 열어두고 트랙을 섞어 내보내는 재생 엔진"""
+
+    def __init__(self, rate: int = 48000, channels: int = 1, chunk: int = 1024,
+                 device_name=None, fade: float = 0.02, crossfade: float = 0.2, smoothing: float = 0.05):
+        self.rate = rate
+        self.channels = channels
+        self.chunk = chunk
+        self.device_name = device_name  # 출력 장치 이름에 포함된 문자열 (예: 'hw:1,0')
+        self.fade_frames = int(fade * rate)
+        self.crossfade_frames = int(crossfade * rate)
+        self.smoothing_frames = int(smoothing * rate)  # 라이브 믹스 게인 변경 시간
+        self.tracks = []  # 마지막 트랙이 현재 트랙, 앞의 것은 페이드 아웃 중
+        self.lock = threading.Lock()
+        self.pa = None
+        self.stream = None
+        self.underruns = 0
+
+    def _device_index(self):
+        if self.device_name is None:
+            return None
+        for i in range(self.pa.get_device_count()):
+            info = self.pa.get_device_info_by_index(i)
+            if info.get('maxOutputChannels', 0) > 0 and self.device_name in info.get('name', ''):
+                return i
+        return None
+
+    def open(self):
+        """출력 스트림 열기 (이미 열려 있으면 그대로 사용)"""
+        if self.stream is not None and self.stream.is_active():
+            return
+        if pyaudio is None:
+            raise RuntimeError("Playback requires the pyaudio package")
+        if self.pa is None:
+            self.pa = pyaudio.PyAudio()
+        self.stream = self.pa.open(format=pyaudio.paInt16,
+                                   channels=self.channels,
+                                   rate=self.rate,
+                                   output=True,
+                                   output_device_index=self._device_index(),
+                                   frames_per_buffer=self.chunk,
+                                   stream_callback=self._callback)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.pa is not None:
+            self.pa.terminate()
+            self.pa = None
+
+    def _fit(self, pcm, rate, channels):
+        """PCM 을 엔진 포맷 (프레임, 엔진 채널) 으로 변환"""
+        pcm = np.asarray(pcm, dtype=np.int16).reshape(-1, channels)
+        if channels != self.channels:
+            mono = pcm.mean(axis=1, dtype=np.float32).astype(np.int16)
+            pcm = np.repeat(mono[:, None], self.channels, axis=1)
+        return resample(pcm, rate, self.rate)
+
+    def play(self, name, pcm, rate, channels=1, loop=False, fade_in=None, crossfade=None):
+        """트랙 재생 시작. 기존 트랙은 crossfade 동안 페이드 아웃 (0 이면 즉시 교체)"""
+        track = _Track(name, self._fit(pcm, rate, channels), loop, 0.0, 1.0, 0.0)
+        self._start(track, fade_in, crossfade)
+        return track
+
+    def play_stream(self, name, rate, channels, nframes, fade_in=None, crossfade=None):
+        """아직 렌더링 중인 PCM 을 재생하는 트랙 시작
+
+        반환된 트랙의 pcm 버퍼 ((프레임, 채널) int16)에 앞에서부터 채우고 available 을 늘리면
+        채워진 곳까지 재생함. 엔진 포맷과 다르면 None (전체 렌더링 후 play 사용)
+        """
+        if rate != self.rate or channels != self.channels:
+            return None
+        track = _Track(name, np.zeros((nframes, channels), dtype=np.int16), False, 0.0, 1.0, 0.0)
+        track.available = 0
+        self._start(track, fade_in, crossfade)
+        return track
+
+    def play_live(self, name, layers, fade_in=None, crossfade=None):
+        """라이브 믹스 시작. layers 는 (이름, PCM, 샘플레이트, 채널 수, 게인) 목록, 모든 트랙은 반복 재생"""
+        if not layers:
+            raise ValueError("Live mix needs at least one layer")
+        tracks = []
+        for layer_name, pcm, rate, channels, gain in layers:
+            layer = _Track(layer_name, self._fit(pcm, rate, channels), True, 0.0, 0.0, 0.0)
+            layer.ramp_to(max(float(gain), 0.0), 0)
+            tracks.append(layer)
+        live = _LiveMix(name, tracks, self.channels, self.smoothing_frames)
+        self._start(live, fade_in, crossfade)
+        return live
+
+    def set_live_gain(self, index, gain, smoothing=None):
+        """재생 중인 라이브 믹스의 index 번째 트랙 게인 변경 (라이브 믹스가 없으면 False)"""
+        with self.lock:
+            current = self.tracks[-1] if self.tracks and self.tracks[-1].target > 0 else None
+            if not isinstance(current, _LiveMix):
+                return False
+            current.set_gain(index, gain, None if smoothing is None else int(smoothing * self.rate))
+            return True
+
+    def _start(self, track, fade_in, crossfade):
+        fade_frames = self.fade_frames if fade_in is None else int(fade_in * self.rate)
+        cross_frames = self.crossfade_frames if crossfade is None else int(crossfade * self.rate)
+        self.open()
+        with self.lock:
+            for other in self.tracks:
+                other.ramp_to(0.0, cross_frames)
+            self.tracks = [t for t in self.tracks if not t.finished]
+            if cross_frames > 0 and self.tracks:
+                fade_frames = max(fade_frames, cross_frames)
+            track.started_at = time()
+            track.ramp_to(1.0, fade_frames)
+            self.tracks.append(track)
+
+    def stop(self, fade_out=None):
+        """재생 정지 (fade_out=0 이면 즉시)"""
+        fade_frames = self.fade_frames if fade_out is None else int(fade_out * self.rate)
+        with self.lock:
+            for track in self.tracks:
+                track.ramp_to(0.0, fade_frames)
+            self.tracks = [t for t in self.tracks if not t.finished]
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if pyaudio is not None and status & pyaudio.paOutputUnderflow:
+            self.underruns += 1
+        mix = np.zeros((frame_count, self.channels), dtype=np.float32)
+        with self.lock:
+            for track in self.tracks:
+                frames = track.read(frame_count)
+                env = track.envelope(len(frames))
+                if env is None:
+                    mix[:len(frames)] += frames * track.gain
+                else:
+                    mix[:len(frames)] += frames * env[:, None]
+                if len(frames) and not track.rendered.is_set():
+                    track.rendered_at = time()
+                    track.rendered.set()
+            self.tracks = [t for t in self.tracks if not t.finished]
+        out = np.clip(mix, -32768, 32767).astype(np.int16)
+        return (out.tobytes(), pyaudio.paContinue)
+
+    def state(self):
+        """현재 재생 상태"""
+        with self.lock:
+            current = self.tracks[-1] if self.tracks and self.tracks[-1].target > 0 else None
+            return {
+                "playing": current is not None,
+                "file": current.name if current else None,
+                "loop": current.loop if current else False,
+                "position": round(current.pos / self.rate, 3) if current else 0.0,
+                "duration": round(len(current.pcm) / self.rate, 3) if current else 0.0,
+                "loops": current.loops if current else 0,
+                "started_at": current.started_at if current else None,
+                "fading_tracks": len(self.tracks) - (1 if current else 0),
+                "stream_active": self.stream is not None and self.stream.is_active(),
+                "underruns": self.underruns,
+                "layers": current.layer_state() if isinstance(current, _LiveMix) else None,
+            }
@@ -0,0 +1,124 @@
+"""
+녹음 파일 인덱스 모듈
+record_dir 는 시작할 때 한 번만 스캔하고, 이후에는 세그먼트를 쓸 때마다 항목을 추가/갱신해
+목록 조회 비용이 녹음 파일 수와 무관하도록 함 (수정 시각 순으로 정렬된 메모리 인덱스)
+"""
+import bisect
+import json
+import os
+import threading
+from utils.init import config
+
+
+class RecordingIndex:
+    """record_dir WAV 파일의 메모리 인덱스"""
+
+    def __init__(self, record_dir: str):
+        self.record_dir = record_dir
+        self.entries = {}  # 파일 이름 -> 항목
+        self.order = []  # (mtime, 파일 이름) 오름차순
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.scanned = False
+
+    def _entry(self, name, meta=None):
+        path = os.path.join(self.record_dir, name)
+        stat = os.stat(path)
+        if meta is None:
+            try:
+                with open(os.path.splitext(path)[0] + '.json') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = {}
+        return {
+            "name": name,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "start_time": meta.get("start_time"),
+            "duration": meta.get("duration"),
+            "event": bool(meta.get("event", False)),
+            "trigger": meta.get("trigger"),
+            "peak_level": meta.get("peak_level"),
+        }
+
+    def scan(self):
+        """record_dir 전체 스캔 (시작 시 한 번)"""
+        entries = {}
+        for name in os.listdir(self.record_dir):
+            if name.endswith('.wav'):
+                try:
+                    entries[name] = self._entry(name)
+                except OSError:
+                    pass
+        with self.lock:
+            self.entries = entries
+            self.order = sorted((e["mtime"], name) for name, e in entries.items())
+            self.total_bytes = sum(e["size"] for e in entries.values())
+            self.scanned = True
+
+    def _remove(self, name):
+        entry = self.entries.pop(name, None)
+        if entry is not None:
+            i = bisect.bisect_left(self.order, (entry["mtime"], name))
+            if i < len(self.order) and self.order[i] == (entry["mtime"], name):
+                del self.order[i]
+            self.total_bytes -= entry["size"]
+        return entry
+
+    def add(self, filename, meta=None):
+        """세그먼트 저장 후 호출 (같은 이름이면 갱신)"""
+        name = os.path.basename(filename)
+        try:
+            entry = self._entry(name, meta)
+        except OSError:
+            return
+        with self.lock:
+            self._remove(name)
+            self.entries[name] = entry
+            bisect.insort(self.order, (entry["mtime"], name))
+            self.total_bytes += entry["size"]
+
+    def remove(self, filename):
+        """삭제된 파일을 인덱스에서 제거"""
+        with self.lock:
+            return self._remove(os.path.basename(filename))
+
+    def oldest(self, count, event=None, before=None):
+        """오래된 순서로 최대 count 개 항목 (event: 이벤트 세그먼트 여부 필터, before: mtime 상한)"""
+        items = []
+        with self.lock:
+            for mtime, name in self.order:
+                if len(items) >= count or (before is not None and mtime >= before):
+                    break
+                entry = self.entries[name]
+                if event is None or entry["event"] == event:
+                    items.append(dict(entry))
+        return items
+
+    def page(self, offset=0, limit=50, since=None, until=None, event=None, query=None):
+        """최신순 목록 한 페이지와 조건에 맞는 전체 개수
+
+        since/until 은 mtime (epoch 초) 범위, event 는 이벤트 세그먼트 여부, query 는 파일 이름 부분 문자열
+        """
+        with self.lock:
+            lo = 0 if since is None else bisect.bisect_left(self.order, (since, ''))
+            hi = len(self.order) if until is None else bisect.bisect_right(self.order, (until, '\uffff'))
+            if event is None and not query:
+                total = max(hi - lo, 0)
+                start = max(hi - offset, lo)
+                names = [name for _, name in reversed(self.order[max(start - limit, lo):start])]
+            else:
+                matched = [name for _, name in reversed(self.order[lo:hi])
+                           if (event is None or self.entries[name]["event"] == event)
+                           and (not query or query in name)]
+                total = len(matched)
+                names = matched[offset:offset + limit]
+            return {"total": total, "offset": offset, "limit": limit,
+                    "items": [dict(self.entries[name]) for name in names]}
+
+    def get_statistics(self):
+        with self.lock:
+            return {"files": len(self.entries), "bytes": self.total_bytes, "scanned": self.scanned}
+
+
+recordings_index = RecordingIndex(config.get('files', 'record_dir'))
@@ -0,0 +1,207 @@
+"""
+녹음 보관 정책 모듈
+record_dir 의 녹음을 주기적으로 정리
+- 보관 기간: 일반 세그먼트는 max_age_days, 이벤트 세그먼트(사이드카 event)는 event_max_age_days
+- 전체 용량 상한(max_megabytes): 오래된 일반 세그먼트부터, 없으면 이벤트 세그먼트 삭제
+- 남은 공간 하한(min_free_megabytes): 일반 세그먼트만 삭제 (녹음 외의 파일이 디스크를 채운 경우
+  이벤트 세그먼트까지 지우지 않고 경고만 남김)
+- utils.archive 의 닫힌 아카이브 파일도 같은 보관 기간과 용량 정책 적용 (오래된 파일부터,
+  용량이 부족하면 일반 세그먼트보다 먼저 삭제)
+- 삭제는 낮은 I/O 우선순위 스레드에서 batch_size 개씩, 한 번 실행에 최대 max_deletes_per_run 개
+"""
+import asyncio
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from utils.init import config, logger
+from utils.recordings import recordings_index
+from utils.archive import archive
+
+MB = 1024 * 1024
+
+
+def _lower_priority():
+    # nice 값이 가장 낮은 스레드는 I/O 스케줄러에서도 가장 낮은 best-effort 우선순위를 받음
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+class RetentionManager:
+    """녹음 파일 보관 기간/용량 관리"""
+
+    def __init__(self, index, record_dir: str, max_age_days: float = 7, event_max_age_days: float = 30,
+                 max_megabytes: float = 0, min_free_megabytes: float = 0, batch_size: int = 20,
+                 batch_pause: float = 0.5, interval: float = 60, max_deletes_per_run: int = 500, archive=None):
+        self.index = index
+        self.archive = archive  # AudioArchive (None 이면 아카이브는 관리하지 않음)
+        self.record_dir = record_dir
+        self.max_age = max_age_days * 86400  # 0 이면 사용 안 함
+        self.event_max_age = event_max_age_days * 86400
+        self.max_bytes = max_megabytes * MB
+        self.min_free_bytes = min_free_megabytes * MB
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.interval = interval
+        self.max_deletes_per_run = max_deletes_per_run  # 0 이면 제한 없음
+        self.unmet = None  # 삭제할 세그먼트가 없어 만족하지 못한 정책
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='retention',
+                                           initializer=_lower_priority)
+        self.deleted = {"age": 0, "quota": 0, "free_space": 0}
+        self.deleted_bytes = 0
+        self.deleted_archives = 0
+        self.last_run = None
+
+    def _delete(self, entries, reason):
+        """WAV 와 사이드카 삭제 후 인덱스에서 제거, 삭제한 파일 수 반환
+
+        용량 정책(quota, free_space)으로 삭제할 때는 파일마다 다시 확인해 만족하면 멈춤
+        """
+        freed = 0
+        count = 0
+        for entry in entries:
+            if reason != "age" and self._over_quota() is None:
+                break
+            path = os.path.join(self.record_dir, entry["name"])
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f'Retention - failed to delete {entry["name"]}: {e}')
+                continue
+            try:
+                os.remove(os.path.splitext(path)[0] + '.json')
+            except OSError:
+                pass
+            self.index.remove(entry["name"])
+            self.deleted[reason] += 1
+            freed += entry["size"]
+            count += 1
+        self.deleted_bytes += freed
+        return count
+
+    def _used_bytes(self):
+        used = self.index.total_bytes
+        if self.archive is not None:
+            used += self.archive.total_bytes()
+        return used
+
+    def _over_quota(self):
+        if self.max_bytes and self._used_bytes() > self.max_bytes:
+            return "quota"
+        if self.min_free_bytes and shutil.disk_usage(self.record_dir).free < self.min_free_bytes:
+            return "free_space"
+        return None
+
+    def _next_batch(self):
+        """삭제할 다음 배치와 사유 (없으면 빈 목록)"""
+        now = time()
+        if self.max_age:
+            batch = self.index.oldest(self.batch_size, event=False, before=now - self.max_age)
+            if batch:
+                return batch, "age"
+        if self.event_max_age:
+            batch = self.index.oldest(self.batch_size, event=True, before=now - self.event_max_age)
+            if batch:
+                return batch, "age"
+        reason = self._over_quota()
+        if reason is None:
+            return [], None
+        # 일반 세그먼트를 먼저, 녹음 용량 상한을 넘은 경우에만 이벤트 세그먼트까지 삭제
+        batch = self.index.oldest(self.batch_size, event=False)
+        if not batch and reason == "quota":
+            batch = self.index.oldest(self.batch_size, event=True)
+        if not batch:
+            self.unmet = reason
+        return batch, reason
+
+    def _run_archive(self):
+        """보관 기간이 지났거나 용량이 부족하면 가장 오래된 닫힌 아카이브 파일 하나를 삭제"""
+        if self.archive is None:
+            return 0
+        containers = self.archive.files(closed_only=True)
+        if not containers:
+            return 0
+        oldest = containers[0]
+        if self.max_age and oldest["end_time"] < time() - self.max_age:
+            reason = "age"
+        else:
+            reason = self._over_quota()
+        if reason is None:
+            return 0
+        freed = self.archive.remove(oldest["name"])
+        if not freed:
+            return 0
+        self.deleted[reason] += 1
+        self.deleted_archives += 1
+        self.deleted_bytes += freed
+        return 1
+
+    def _run_batch(self):
+        if self._run_archive():
+            return 1
+        batch, reason = self._next_batch()
+        return self._delete(batch, reason) if batch else 0
+
+    async def run_once(self):
+        """정책을 만족할 때까지 배치 단위로 삭제 (한 번에 최대 max_deletes_per_run 개)"""
+        loop = asyncio.get_running_loop()
+        self.unmet = None
+        deleted = 0
+        while True:
+            count = await loop.run_in_executor(self.executor, self._run_batch)
+            if not count:
+                break
+            deleted += count
+            if self.max_deletes_per_run and deleted >= self.max_deletes_per_run:
+                logger.warning(f'Retention - stopped after deleting {deleted} recordings in one run')
+                break
+            await asyncio.sleep(self.batch_pause)
+        if self.unmet == "free_space":
+            logger.warning('Retention - free space is still below min_free_megabytes, event segments are kept')
+        self.last_run = time()
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f'Retention - {e}')
+            await asyncio.sleep(self.interval)
+
+    def get_statistics(self):
+        usage = shutil.disk_usage(self.record_dir)
+        return {
+            "disk": {"total": usage.total, "used": usage.used, "free": usage.free},
+            "recordings": self.index.get_statistics(),
+            "archive_bytes": self.archive.total_bytes() if self.archive is not None else 0,
+            "policy": {
+                "max_age_days": self.max_age / 86400,
+                "event_max_age_days": self.event_max_age / 86400,
+                "max_bytes": self.max_bytes,
+                "min_free_bytes": self.min_free_bytes,
+                "max_deletes_per_run": self.max_deletes_per_run,
+            },
+            "deleted": dict(self.deleted),
+            "deleted_bytes": self.deleted_bytes,
+            "deleted_archives": self.deleted_archives,
+            "last_run": self.last_run,
+            "unmet": self.unmet,
+        }
+
+
+retention_manager = RetentionManager(
+    recordings_index, config.get('files', 'record_dir'),
+    max_age_days=config.getfloat('retention', 'max_age_days', fallback=7),
+    event_max_age_days=config.getfloat('retention', 'event_max_age_days', fallback=30),
+    max_megabytes=config.getfloat('retention', 'max_megabytes', fallback=0),
+    min_free_megabytes=config.getfloat('retention', 'min_free_megabytes', fallback=0),
+    batch_size=config.getint('retention', 'batch_size', fallback=20),
+    batch_pause=config.getfloat('retention', 'batch_pause', fallback=0.5),
+    interval=config.getfloat('retention', 'interval', fallback=60),
+    max_deletes_per_run=config.getint('retention', 'max_deletes_per_run', fallback=500),
+    archive=archive)
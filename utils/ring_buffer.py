@@ -0,0 +1,152 @@
+"""
+캡처 오디오 링 버퍼 모듈
+PortAudio 콜백에서 청크를 O(1)로 기록하고, 최근 N초 구간을 복사 없이 읽을 수 있도록 함
+"""
+import threading
+import numpy as np
+from datetime import datetime
+
+
+class AudioRingBuffer:
+    """미리 할당된 고정 크기 int16 링 버퍼 (채널 인터리브 샘플 저장)"""
+
+    def __init__(self, capacity_frames: int, channels: int = 1, rate: int = 16000, chunk: int = 1024):
+        self.capacity = capacity_frames  # 채널당 최대 프레임 수
+        self.channels = channels
+        self.rate = rate
+        self.buffer = np.zeros(capacity_frames * channels, dtype=np.int16)
+        self.write_pos = 0  # 다음 쓰기 위치 (샘플 단위)
+        self.total_frames = 0  # 지금까지 기록된 누적 프레임 수
+        self.lock = threading.Lock()
+
+        # 청크별 ADC 캡처 시각 (누적 프레임 번호 -> 벽시계 시각)
+        num_anchors = -(-capacity_frames // chunk) + 2
+        self.anchor_frames = np.full(num_anchors, -1, dtype=np.int64)
+        self.anchor_times = np.zeros(num_anchors, dtype=np.float64)
+        self.anchor_pos = 0
+
+        # 갭 카운터 (연속 스냅샷 기준)
+        self.next_frame = None  # 직전 연속 스냅샷의 끝 프레임
+        self.lost_frames = 0  # 읽기 전에 덮어써져 잃은 프레임
+        self.duplicated_frames = 0  # 이전 스냅샷과 겹쳐 중복된 프레임
+        self.overflows = 0  # PortAudio 입력 오버플로우 횟수
+
+    def write(self, in_data: bytes, overflow=False, capture_time=None):
+        """콜백에서 받은 청크를 버퍼에 기록 (할당 없이 덮어쓰기)
+
+        capture_time 은 청크 첫 샘플의 ADC 캡처 시각 (epoch 초)
+        """
+        if overflow:
+            self.overflows += 1
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        nframes = len(samples) // self.channels
+        size = len(self.buffer)
+        if len(samples) > size:
+            # 버퍼보다 큰 청크는 마지막 부분만 유지
+            samples = samples[-size:]
+        n = len(samples)
+        with self.lock:
+            if capture_time is not None:
+                self.anchor_frames[self.anchor_pos] = self.total_frames
+                self.anchor_times[self.anchor_pos] = capture_time
+                self.anchor_pos = (self.anchor_pos + 1) % len(self.anchor_frames)
+            end = self.write_pos + n
+            if end <= size:
+                self.buffer[self.write_pos:end] = samples
+            else:
+                first = size - self.write_pos
+                self.buffer[self.write_pos:] = samples[:first]
+                self.buffer[:n - first] = samples[first:]
+            self.write_pos = end % size
+            self.total_frames += nframes
+
+    def available_frames(self):
+        """버퍼에 실제로 채워진 프레임 수"""
+        return min(self.total_frames, self.capacity)
+
+    def _segments(self, start_frame, end_frame):
+        """누적 프레임 구간 [start_frame, end_frame) 의 memoryview 리스트 (버퍼에 남아있는 구간이어야 함)"""
+        n = (end_frame - start_frame) * self.channels
+        if n <= 0:
+            return []
+        size = len(self.buffer)
+        start = (self.write_pos - (self.total_frames - start_frame) * self.channels) % size
+        if start + n <= size:
+            return [memoryview(self.buffer[start:start + n])]
+        return [memoryview(self.buffer[start:]), memoryview(self.buffer[:start + n - size])]
+
+    def latest(self, nframes=None):
+        """최근 nframes 구간을 memoryview 리스트(최대 2조각)로 반환 - 복사 없음
+
+        스트림이 동작 중이면 내용이 덮어써질 수 있으므로 stop_stream 상태에서 사용
+        """
+        available = self.available_frames()
+        if nframes is None or nframes > available:
+            nframes = available
+        return self._segments(self.total_frames - nframes, self.total_frames)
+
+    def latest_seconds(self, seconds):
+        """최근 seconds 초 구간의 memoryview 리스트 반환"""
+        return self.latest(int(seconds * self.rate))
+
+    def snapshot(self, start_frame=None, nframes=None, end_frame=None):
+        """스트림을 멈추지 않고 구간을 복사해 (시작 프레임, 샘플 배열)로 반환
+
+        start_frame 을 주면 그 프레임부터 end_frame (기본: 현재)까지 연속 구간을 복사하고,
+        직전 연속 스냅샷과 비교해 누락/중복 프레임을 갭 카운터에 누적함
+        start_frame 이 없으면 최근 nframes (기본: 버퍼 전체) 구간을 복사
+        """
+        with self.lock:
+            end = self.total_frames if end_frame is None else min(end_frame, self.total_frames)
+            oldest = self.total_frames - self.available_frames()
+            if start_frame is None:
+                start = oldest if nframes is None else max(end - nframes, oldest)
+            else:
+                start = min(max(start_frame, oldest), end)
+                if start > start_frame:
+                    self.lost_frames += start - start_frame
+                if self.next_frame is not None and start_frame < self.next_frame:
+                    self.duplicated_frames += max(min(self.next_frame, end) - start, 0)
+                self.next_frame = end
+            segments = self._segments(start, end)
+            data = np.concatenate(segments) if segments else np.zeros(0, dtype=np.int16)
+        return start, data
+
+    def time_at(self, frame):
+        """누적 프레임 번호의 캡처 시각 (가장 가까운 이전 청크 기준, 없으면 None)"""
+        with self.lock:
+            frames = self.anchor_frames.copy()
+            times = self.anchor_times.copy()
+        valid = frames >= 0
+        if not valid.any():
+            return None
+        before = valid & (frames <= frame)
+        if before.any():
+            i = np.argmax(np.where(before, frames, -1))
+        else:
+            # 기록이 남아있지 않은 오래된 프레임은 가장 오래된 청크에서 역산
+            i = np.argmin(np.where(valid, frames, np.iinfo(np.int64).max))
+        return float(times[i] + (frame - frames[i]) / self.rate)
+
+    def segment_info(self, start_frame, nframes):
+        """세그먼트의 시작 샘플, 시작 시각, 길이 정보 반환"""
+        start_time = self.time_at(start_frame)
+        return {
+            "start_sample": int(start_frame),
+            "num_samples": int(nframes),
+            "start_time": round(start_time, 6) if start_time is not None else None,
+            "start_time_iso": datetime.fromtimestamp(start_time).isoformat(timespec='milliseconds') if start_time is not None else None,
+            "duration": nframes / self.rate,
+            "sample_rate": self.rate,
+            "channels": self.channels
+        }
+
+    def get_statistics(self):
+        """캡처 버퍼 통계 반환"""
+        return {
+            "total_frames": self.total_frames,
+            "buffered_seconds": self.available_frames() / self.rate,
+            "lost_frames": self.lost_frames,
+            "duplicated_frames": self.duplicated_frames,
+            "overflows": self.overflows
+        }
@@ -0,0 +1,153 @@
+"""
+음원 라이브러리 캐시 모듈
+sound_dir 의 WAV 를 한 번 인덱싱하고 PCM 데이터 영역을 메모리 매핑해
+재생/믹싱에 복사 없는 int16 배열로 제공 (파일이 바뀌면 다시 매핑)
+- 매핑은 LRU 로 관리하며 최대 크기(max_bytes)를 넘으면 오래된 것부터 해제
+- 음원 교체는 덮어쓰기가 아닌 이름 변경(os.replace/shutil.move)으로 해야 재생 중인 매핑이 안전함
+- 16비트 PCM 이 아닌 WAV 는 디코딩한 복사본을 같은 LRU 에 보관
+"""
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+import numpy as np
+from utils.encoder import read_wav
+
+
+def parse_wav_header(f):
+    """RIFF 청크를 따라가며 (포맷 태그, 채널, 샘플레이트, 비트, data 오프셋, data 크기) 반환"""
+    riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+    if riff != b'RIFF' or wave_id != b'WAVE':
+        raise ValueError("Not a RIFF/WAVE file")
+    fmt = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError("WAV file has no data chunk")
+        chunk_id, size = struct.unpack('<4sI', header)
+        if chunk_id == b'fmt ':
+            fmt = struct.unpack('<HHIIHH', f.read(16))
+            f.seek(size - 16 + (size & 1), os.SEEK_CUR)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            return fmt[0], fmt[1], fmt[2], fmt[5], f.tell(), size
+        else:
+            f.seek(size + (size & 1), os.SEEK_CUR)
+
+
+class _Entry:
+    """매핑된 음원 하나"""
+
+    def __init__(self, path, stat, pcm, rate, channels, mapped):
+        self.path = path
+        self.key = (stat.st_mtime_ns, stat.st_size)  # 변경 감지용
+        self.pcm = pcm
+        self.rate = rate
+        self.channels = channels
+        self.mapped = mapped  # False 면 디코딩한 복사본
+        self.nbytes = pcm.nbytes
+
+
+class SoundLibrary:
+    """경로 -> 메모리 매핑된 PCM 캐시"""
+
+    def __init__(self, sound_dir: str, max_bytes: int = 64 * 1024 * 1024):
+        self.sound_dir = sound_dir
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # realpath -> _Entry (LRU 순서)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _path(self, name):
+        path = name if os.path.isabs(name) or os.path.dirname(name) else os.path.join(self.sound_dir, name)
+        return os.path.realpath(path)
+
+    def _load(self, path, stat):
+        with open(path, 'rb') as f:
+            fmt_tag, channels, rate, bits, offset, size = parse_wav_header(f)
+            if fmt_tag == 1 and bits == 16:
+                size = min(size, stat.st_size - offset) // (2 * channels) * (2 * channels)
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if hasattr(mm, 'madvise'):
+                    mm.madvise(mmap.MADV_WILLNEED)  # 미리 페이지 캐시로 읽어 재생 시작 지연 제거
+                pcm = np.frombuffer(mm, dtype='<i2', count=size // 2, offset=offset)
+                return _Entry(path, stat, pcm, rate, channels, True)
+        pcm, rate, channels = read_wav(path)
+        return _Entry(path, stat, pcm, rate, channels, False)
+
+    def get(self, name):
+        """음원의 (int16 PCM 배열 (읽기 전용), 샘플레이트, 채널 수) 반환
+
+        name 은 sound_dir 안의 파일 이름 또는 경로. 파일이 바뀌었으면 다시 매핑
+        """
+        path = self._path(name)
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry.key == (stat.st_mtime_ns, stat.st_size):
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry.pcm, entry.rate, entry.channels
+            if entry is not None:
+                self._evict(path)
+                self.reloads += 1
+            else:
+                self.misses += 1
+        entry = self._load(path, stat)
+        with self.lock:
+            if path in self.entries:
+                self._evict(path)
+            self.entries[path] = entry
+            self.total_bytes += entry.nbytes
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                self._evict(next(iter(self.entries)))
+        return entry.pcm, entry.rate, entry.channels
+
+    def _evict(self, path):
+        # 배열을 들고 있는 쪽이 없어지면 매핑도 함께 해제됨
+        entry = self.entries.pop(path)
+        self.total_bytes -= entry.nbytes
+
+    def invalidate(self, name=None):
+        """캐시 무효화 (name 이 없으면 전체)"""
+        with self.lock:
+            if name is None:
+                self.entries.clear()
+                self.total_bytes = 0
+            elif self._path(name) in self.entries:
+                self._evict(self._path(name))
+
+    def names(self):
+        """sound_dir 의 WAV 파일 이름 목록"""
+        return sorted(f for f in os.listdir(self.sound_dir) if f.lower().endswith('.wav'))
+
+    def preload(self):
+        """sound_dir 의 모든 WAV 를 미리 매핑"""
+        for name in self.names():
+            try:
+                self.get(name)
+            except (OSError, ValueError, EOFError, struct.error):
+                pass
+        # 목록에서 사라진 파일 정리
+        existing = {self._path(name) for name in self.names()}
+        with self.lock:
+            for path in [p for p in self.entries if os.path.dirname(p) == os.path.realpath(self.sound_dir) and p not in existing]:
+                self._evict(path)
+
+    def get_statistics(self):
+        """캐시 통계 반환"""
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "mapped": sum(1 for e in self.entries.values() if e.mapped),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+            }
@@ -0,0 +1,175 @@
+"""
+WebSocket 오디오 스트림 코덱 모듈
+스트림 URL 의 dtype 경로 세그먼트로 코덱을 정하고, 메시지(여러 프레임 묶음) 단위로 인코딩/디코딩
+- int16: 원본 PCM
+- ulaw / alaw: G.711 (8비트, 1/2 크기) - 65536 항목 조회 테이블로 벡터 변환
+- adpcm: IMA-ADPCM (4비트, 1/4 크기) - 메시지마다 3바이트 상태 헤더(이전 샘플 int16, 스텝 인덱스 uint8)를
+  붙여 메시지를 독립적으로 디코딩할 수 있음
+- opus: 20ms 패킷을 uint16 길이 접두어로 이어 붙임 (opuslib 필요)
+(test_safety_server 에서도 사용하므로 utils.init 에 의존하지 않음)
+"""
+import struct
+import numpy as np
+
+try:
+    import audioop
+except ImportError:  # Python 3.13 이상에서는 audioop-lts 패키지 필요
+    audioop = None
+
+try:
+    import opuslib
+except ImportError:  # opus 코덱에만 필요
+    opuslib = None
+
+CODECS = ('int16', 'ulaw', 'alaw', 'adpcm', 'opus')
+
+_LINEAR = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32)  # uint16 비트 패턴 순서의 int16 값
+_SEG_UEND = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+_SEG_AEND = np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+
+
+def _ulaw_tables():
+    pcm = _LINEAR >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    pcm = np.minimum(np.abs(pcm), 8159) + 33
+    seg = np.searchsorted(_SEG_UEND, pcm)
+    uval = np.where(seg >= 8, 0x7F, (np.minimum(seg, 7) << 4) | ((pcm >> (np.minimum(seg, 7) + 1)) & 0xF))
+    encode = (uval ^ mask).astype(np.uint8)
+    u = ~np.arange(256) & 0xFF
+    t = (((u & 0xF) << 3) + 0x84) << ((u & 0x70) >> 4)
+    decode = np.where(u & 0x80, 0x84 - t, t - 0x84).astype(np.int16)
+    return encode, decode
+
+
+def _alaw_tables():
+    pcm = _LINEAR >> 3
+    mask = np.where(pcm >= 0, 0xD5, 0x55)
+    pcm = np.where(pcm >= 0, pcm, -pcm - 1)
+    seg = np.searchsorted(_SEG_AEND, pcm)
+    quant = np.where(seg < 2, pcm >> 1, pcm >> np.minimum(seg, 7)) & 0xF
+    aval = np.where(seg >= 8, 0x7F, (np.minimum(seg, 7) << 4) | quant)
+    encode = (aval ^ mask).astype(np.uint8)
+    a = np.arange(256) ^ 0x55
+    seg = (a & 0x70) >> 4
+    t = ((a & 0xF) << 4) + np.where(seg == 0, 8, 0x108)
+    t = np.where(seg > 1, t << np.maximum(seg - 1, 0), t)
+    decode = np.where(a & 0x80, t, -t).astype(np.int16)
+    return encode, decode
+
+
+_ULAW_ENCODE, _ULAW_DECODE = _ulaw_tables()
+_ALAW_ENCODE, _ALAW_DECODE = _alaw_tables()
+
+
+class PCM16:
+    """압축하지 않은 int16 PCM"""
+    name = 'int16'
+
+    def encode(self, data: bytes) -> bytes:
+        return data
+
+    def decode(self, data: bytes) -> bytes:
+        return data
+
+    def reset(self):
+        pass
+
+
+class G711(PCM16):
+    """조회 테이블 기반 µ-law / A-law"""
+
+    def __init__(self, name):
+        self.name = name
+        self.encode_table, self.decode_table = (_ULAW_ENCODE, _ULAW_DECODE) if name == 'ulaw' else (_ALAW_ENCODE, _ALAW_DECODE)
+
+    def encode(self, data: bytes) -> bytes:
+        return self.encode_table[np.frombuffer(data, dtype=np.uint16)].tobytes()
+
+    def decode(self, data: bytes) -> bytes:
+        return self.decode_table[np.frombuffer(data, dtype=np.uint8)].tobytes()
+
+
+class ImaAdpcm(PCM16):
+    """IMA-ADPCM (메시지마다 상태 헤더 포함)"""
+    name = 'adpcm'
+    header = struct.Struct('<hB')
+
+    def __init__(self, channels=1):
+        if audioop is None:
+            raise RuntimeError("IMA-ADPCM requires the audioop module (audioop-lts on Python 3.13+)")
+        if channels != 1:
+            raise ValueError("IMA-ADPCM stream supports mono only")
+        self.state = None
+
+    def reset(self):
+        self.state = None
+
+    def encode(self, data: bytes) -> bytes:
+        valprev, index = self.state or (0, 0)
+        body, self.state = audioop.lin2adpcm(data, 2, self.state)
+        return self.header.pack(valprev, index) + body
+
+    def decode(self, data: bytes) -> bytes:
+        state = self.header.unpack_from(data)
+        pcm, _ = audioop.adpcm2lin(data[self.header.size:], 2, state)
+        return pcm
+
+
+class Opus(PCM16):
+    """20ms Opus 패킷 (uint16 길이 접두어), 남은 샘플은 다음 메시지로 넘김"""
+    name = 'opus'
+    length = struct.Struct('<H')
+
+    def __init__(self, rate, channels=1, bitrate=16000):
+        if opuslib is None:
+            raise RuntimeError("Opus streaming requires the opuslib package")
+        self.rate = rate
+        self.channels = channels
+        self.bitrate = bitrate
+        self.frame_size = rate // 50  # 20ms
+        self.reset()
+
+    def reset(self):
+        self.encoder = opuslib.Encoder(self.rate, self.channels, opuslib.APPLICATION_AUDIO)
+        self.encoder.bitrate = self.bitrate
+        self.decoder = opuslib.Decoder(self.rate, self.channels)
+        self.pending = b''
+
+    def encode(self, data: bytes) -> bytes:
+        data = self.pending + data
+        frame_bytes = self.frame_size * self.channels * 2
+        usable = len(data) // frame_bytes * frame_bytes
+        self.pending = data[usable:]
+        packets = []
+        for start in range(0, usable, frame_bytes):
+            packet = self.encoder.encode(data[start:start + frame_bytes], self.frame_size)
+            packets.append(self.length.pack(len(packet)) + packet)
+        return b''.join(packets)
+
+    def decode(self, data: bytes) -> bytes:
+        pcm, pos = [], 0
+        while pos < len(data):
+            (size,) = self.length.unpack_from(data, pos)
+            pos += self.length.size
+            pcm.append(self.decoder.decode(data[pos:pos + size], self.frame_size))
+            pos += size
+        return b''.join(pcm)
+
+
+def parse_bitrate(value):
+    """'16k' 같은 비트레이트 문자열을 bps 로 변환"""
+    value = str(value).strip().lower()
+    return int(float(value[:-1]) * 1000) if value.endswith('k') else int(value)
+
+
+def get_codec(name, rate, channels=1, bitrate='16k'):
+    """코덱 이름으로 인코더/디코더 객체 생성 (필요한 패키지가 없으면 RuntimeError)"""
+    if name == 'int16':
+        return PCM16()
+    if name in ('ulaw', 'alaw'):
+        return G711(name)
+    if name == 'adpcm':
+        return ImaAdpcm(channels)
+    if name == 'opus':
+        return Opus(rate, channels, parse_bitrate(bitrate))
+    raise ValueError(f"Unknown stream codec: {name}")
@@ -0,0 +1,41 @@
+"""
+스트리밍 음성 구간 검출(VAD) 모듈
+메인 캡처 스트림의 청크를 ~20ms 프레임으로 나누어 에너지와 영교차율을 벡터 연산으로 계산하고,
+적응형 배경 소음 레벨 대비 음성 프레임을 판단해 발화 구간을 asyncio 큐로 전달
+"""
+import numpy as np
+from utils.event_trigger import EventTrigger
+from utils.metering import power_to_db
+
+
+class StreamingVAD(EventTrigger):
+    """프레임 단위 음성 검출기 (기존 speech_recognition 기반 마이크 청취 대체)"""
+    kind = 'speech'
+
+    def __init__(self, rate: int, channels: int = 1, margin_db: float = 9.0, min_level_db: float = -55.0,
+                 max_zcr: float = 0.4, frame_seconds: float = 0.02, pre_roll: float = 0.3,
+                 hangover: float = 0.8, max_speech: float = 30.0, min_speech: float = 0.3):
+        super().__init__(rate, pre_roll=pre_roll, post_roll=hangover, max_event=max_speech,
+                         min_event=min_speech, floor_seconds=5.0)
+        self.channels = channels
+        self.margin_db = margin_db  # 배경 소음 대비 음성 에너지 여유 (dB)
+        self.min_level_db = min_level_db  # 이보다 작은 프레임은 음성으로 보지 않음
+        self.max_zcr = max_zcr  # 영교차율이 이보다 크면 잡음(치찰/히스)으로 판단
+        self.frame_length = int(frame_seconds * rate)
+
+    def is_active(self, in_data, level_db, nframes):
+        """청크 내 프레임의 절반 이상이 음성이면 발화 중으로 판단"""
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        if self.channels > 1:
+            samples = samples[::self.channels]
+        nframes_vad = max(len(samples) // self.frame_length, 1)
+        length = len(samples) // nframes_vad
+        frames = samples[:length * nframes_vad].reshape(nframes_vad, length).astype(np.float32)
+        energy = power_to_db(np.einsum('ij,ij->i', frames, frames) / length)
+        zcr = np.count_nonzero(np.diff(np.signbit(frames), axis=1), axis=1) / length
+        floor = self.noise_floor if self.noise_floor is not None else float(energy.min())
+        speech = (energy - floor >= self.margin_db) & (energy >= self.min_level_db) & (zcr <= self.max_zcr)
+        active = np.count_nonzero(speech) * 2 >= nframes_vad
+        if not active and not self.active:
+            self.track_floor(float(np.median(energy)), nframes)
+        return active
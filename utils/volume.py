@@ -0,0 +1,139 @@
+"""
+스피커 볼륨 컨트롤러 모듈
+ALSA 믹서 핸들을 한 번만 열어 두고 현재 볼륨을 메모리에서 제공
+- 볼륨 상태는 하나의 작은 JSON 파일에 지연 저장 (슬라이더 연속 변경 시 SD 카드 쓰기 최소화)
+- 일정 시간 동안 단계적으로 바꾸는 볼륨 램프 지원
+"""
+import asyncio
+import json
+import os
+import threading
+import alsaaudio
+from utils.init import config, logger
+
+
+class VolumeController:
+    """열린 ALSA 믹서와 캐시된 볼륨"""
+
+    def __init__(self, control: str, cardindex: int, default_volume: int = 90,
+                 state_file: str = '../volume.json', debounce: float = 2.0, ramp_interval: float = 0.02):
+        self.control = control
+        self.cardindex = cardindex
+        self.default_volume = default_volume
+        self.state_file = state_file
+        self.debounce = debounce  # 마지막 변경 후 저장까지 대기 시간 (초)
+        self.ramp_interval = ramp_interval  # 램프 단계 간격 (초)
+        self.mixer = None
+        self.volume = None
+        self.lock = threading.Lock()
+        self.save_timer = None
+        self.ramp_task = None
+        self.mixer_writes = 0
+        self.state_writes = 0
+
+    def _mixer(self):
+        if self.mixer is None:
+            self.mixer = alsaaudio.Mixer(control=self.control, cardindex=self.cardindex)
+        return self.mixer
+
+    def _load_state(self):
+        """저장된 볼륨 (이전 버전의 '<볼륨>.vol' 표시 파일은 옮겨오고 삭제)"""
+        try:
+            with open(self.state_file) as f:
+                return int(json.load(f)['volume'])
+        except (OSError, ValueError, KeyError):
+            pass
+        state_dir = os.path.dirname(self.state_file) or '.'
+        volume = None
+        for file in os.listdir(state_dir):
+            if file.endswith('.vol'):
+                try:
+                    volume = int(file.split('.')[0])
+                    os.remove(os.path.join(state_dir, file))
+                except (ValueError, OSError):
+                    pass
+        if volume is not None:
+            self._write_state(volume)
+        return volume
+
+    def restore(self):
+        """저장된 볼륨(없으면 기본값)을 믹서에 적용"""
+        volume = self._load_state()
+        self.set(self.default_volume if volume is None else volume, persist=False)
+        return self.volume
+
+    def get(self):
+        """현재 볼륨 (믹서를 다시 읽지 않음)"""
+        if self.volume is None:
+            self.volume = self._mixer().getvolume()[0]
+        return self.volume
+
+    def set(self, value, persist=True):
+        """볼륨 즉시 변경 (같은 값이면 ALSA 호출 생략)"""
+        value = max(0, min(100, int(value)))
+        with self.lock:
+            if value != self.volume:
+                self._mixer().setvolume(value)
+                self.mixer_writes += 1
+                self.volume = value
+        if persist:
+            self._schedule_save()
+        return value
+
+    def ramp(self, target, duration):
+        """duration 초 동안 target 까지 단계적으로 변경 (진행 중인 램프는 취소, 이벤트 루프 안에서 호출)"""
+        if self.ramp_task is not None and not self.ramp_task.done():
+            self.ramp_task.cancel()
+        self.ramp_task = asyncio.ensure_future(self._ramp(max(0, min(100, int(target))), duration))
+        return self.ramp_task
+
+    async def _ramp(self, target, duration):
+        start = self.get()
+        steps = max(int(duration / self.ramp_interval), 1)
+        for i in range(1, steps + 1):
+            self.set(round(start + (target - start) * i / steps), persist=False)
+            if i < steps:
+                await asyncio.sleep(self.ramp_interval)
+        self._schedule_save()
+
+    def _schedule_save(self):
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+            self.save_timer = threading.Timer(self.debounce, self.flush)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def flush(self):
+        """지연 중인 볼륨 저장을 바로 수행"""
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            volume = self.volume
+        if volume is not None:
+            self._write_state(volume)
+
+    def _write_state(self, volume):
+        tmp_file = self.state_file + '.part'
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump({"volume": volume}, f)
+            os.replace(tmp_file, self.state_file)
+            self.state_writes += 1
+        except OSError as e:
+            logger.warning(f'Volume - failed to save state: {e}')
+
+    def get_statistics(self):
+        return {
+            "volume": self.volume,
+            "mixer_writes": self.mixer_writes,
+            "state_writes": self.state_writes,
+            "ramping": self.ramp_task is not None and not self.ramp_task.done(),
+        }
+
+
+volume_controller = VolumeController(config.get('audio', 'mixer_control'), config.getint('audio', 'cardindex'),
+                                     default_volume=config.getint('speaker', 'volume'),
+                                     state_file=config.get('speaker', 'volume_state', fallback='../volume.json'),
+                                     debounce=config.getfloat('speaker', 'volume_save_delay', fallback=2.0))
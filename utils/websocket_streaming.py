@@ -8,8 +8,10 @@ import numpy as np
 import time
 from datetime import datetime
 from typing import Optional
-import aiohttp
 from utils.init import config, deviceId, logger
+from utils.http_client import get_session
+from utils.channels import output_channels, DEFAULT_CHANNEL
+from utils.stream_codecs import get_codec
 
 class WebSocketStreamer:
     def __init__(self):
@@ -19,7 +21,21 @@ class WebSocketStreamer:
         self.device_id = deviceId
         self.sample_rate = config.getint('audio', 'rate')
         self.chunk_size = config.getint('audio', 'chunk')
-        self.streaming_interval = config.getfloat('websocket', 'streaming_interval')
+        self.streaming_interval = config.getfloat('websocket', 'streaming_interval')  # 메시지 전송 간격 (초)
+        self.frames_per_message = config.getint('websocket', 'frames_per_message', fallback=4)  # 메시지당 최대 프레임 수
+        self.max_latency = config.getfloat('websocket', 'max_latency', fallback=1.0)  # 이보다 오래된 프레임은 버림 (초)
+        self.frame_duration = self.chunk_size / self.sample_rate
+        
+        # 스트림 코덱 (URL 의 dtype 세그먼트로 서버에 알림)
+        channels = output_channels(config.getint('audio', 'channels'), config.get('websocket', 'channel', fallback=DEFAULT_CHANNEL))
+        codec_name = config.get('websocket', 'codec', fallback='int16')
+        try:
+            self.codec = get_codec(codec_name, self.sample_rate, channels, config.get('websocket', 'opus_bitrate', fallback='16k'))
+        except (RuntimeError, ValueError) as e:
+            logger.warning(f"WebSocket 코덱 {codec_name} 사용 불가, int16 으로 전송: {e}")
+            self.codec = get_codec('int16', self.sample_rate, channels)
+        self.raw_bytes = 0
+        self.sent_bytes = 0
         
         # WebSocket URL 구성
         if self.server_host.startswith('https://'):
@@ -33,9 +49,9 @@ class WebSocketStreamer:
             host = self.server_host
             
         if self.server_port == 0:
-            self.ws_url = f"{protocol}://{host}/ws/room/{self.room_name}/{self.sample_rate}/int16/{self.device_id}"
+            self.ws_url = f"{protocol}://{host}/ws/room/{self.room_name}/{self.sample_rate}/{self.codec.name}/{self.device_id}"
         else:
-            self.ws_url = f"{protocol}://{host}:{self.server_port}/ws/room/{self.room_name}/{self.sample_rate}/int16/{self.device_id}"
+            self.ws_url = f"{protocol}://{host}:{self.server_port}/ws/room/{self.room_name}/{self.sample_rate}/{self.codec.name}/{self.device_id}"
         
         # 연결 상태 및 통계
         self.websocket = None
@@ -44,9 +60,15 @@ class WebSocketStreamer:
         self.connection_retries = 0
         self.max_retries = 5
         
-        # 오디오 버퍼
-        self.stream_buffer = []
-        self.buffer_lock = asyncio.Lock()
+        # 오디오 큐 (record_callback 스레드 -> 이벤트 루프), 항목은 (캡처 시각, 청크)
+        self.queue = None
+        self.loop = None
+        self.sent_messages = 0
+        self.dropped_overflow = 0  # 큐가 가득 차서 버린 프레임
+        self.dropped_latency = 0  # max_latency 를 넘겨 버린 프레임
+        self.dropped_send = 0  # 전송 실패로 잃은 프레임 (재연결 후 다시 보내지 않음)
+        self.latency = 0.0  # 마지막 메시지의 가장 오래된 프레임 지연 (초)
+        self.max_observed_latency = 0.0
         
         logger.info(f"WebSocket Streamer 초기화: {self.ws_url}")
 
@@ -67,19 +89,18 @@ class WebSocketStreamer:
         else:
             create_url = f"{protocol}://{host}:{self.server_port}/v1/create_room"
         
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(create_url, json={"room_name": self.room_name}) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        logger.info(f"방 생성 성공: {result.get('message', 'Success')}")
-                    elif response.status == 409:
-                        # 방이 이미 존재하는 경우
-                        logger.info(f"방이 이미 존재함: {self.room_name}")
-                    else:
-                        logger.warning(f"방 생성 응답 코드: {response.status}")
-            except Exception as e:
-                logger.warning(f"방 생성 요청 실패 (이미 존재할 수 있음): {e}")
+        try:
+            async with get_session().post(create_url, json={"room_name": self.room_name}) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    logger.info(f"방 생성 성공: {result.get('message', 'Success')}")
+                elif response.status == 409:
+                    # 방이 이미 존재하는 경우
+                    logger.info(f"방이 이미 존재함: {self.room_name}")
+                else:
+                    logger.warning(f"방 생성 응답 코드: {response.status}")
+        except Exception as e:
+            logger.warning(f"방 생성 요청 실패 (이미 존재할 수 있음): {e}")
 
     async def connect(self):
         """WebSocket 서버에 연결"""
@@ -99,6 +120,7 @@ class WebSocketStreamer:
                 ping_timeout=10
             )
             
+            self.codec.reset()  # 새 연결은 새 디코더 상태에서 시작
             self.is_connected = True
             self.connection_retries = 0
             logger.info("WebSocket 연결 성공!")
@@ -135,21 +157,52 @@ class WebSocketStreamer:
         
         return await self.connect()
 
-    async def add_audio_data(self, audio_data: bytes):
-        """오디오 데이터를 스트리밍 버퍼에 추가"""
-        if not self.is_connected:
-            return
-            
-        async with self.buffer_lock:
-            self.stream_buffer.append(audio_data)
-            
-            # 버퍼가 너무 크면 오래된 데이터 제거 (메모리 보호)
-            if len(self.stream_buffer) > 100:  # 약 6.4초분량
-                self.stream_buffer.pop(0)
+    def attach(self, loop):
+        """콜백 청크를 받을 asyncio 큐 생성 (이벤트 루프 안에서 호출)"""
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        return self.queue
+
+    def feed(self, audio_data: bytes):
+        """record_callback 스레드에서 호출 - 청크를 이벤트 루프의 큐로 넘김"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._enqueue, audio_data)
+
+    @property
+    def max_queue(self):
+        """max_latency 만큼의 프레임 + 한 메시지 분량"""
+        return int(self.max_latency / self.frame_duration) + self.frames_per_message
+
+    @property
+    def dropped_frames(self):
+        return self.dropped_overflow + self.dropped_latency + self.dropped_send
+
+    def _enqueue(self, audio_data):
+        # 재연결 중에도 max_latency 안의 프레임은 보관했다가 연결 후 따라잡음
+        if self.queue.qsize() >= self.max_queue:
+            # 메모리 보호: 가장 오래된 프레임 제거
+            self.queue.get_nowait()
+            self.dropped_overflow += 1
+        self.queue.put_nowait((time.monotonic(), audio_data))
+
+    async def _next_message(self):
+        """첫 프레임을 기다린 뒤, 밀린 프레임을 frames_per_message 까지 묶어 반환 (max_latency 보다 오래된 프레임은 버림)"""
+        while True:
+            first = await self.queue.get()
+            if time.monotonic() - first[0] <= self.max_latency:
+                break
+            self.dropped_latency += 1
+        frames = [first]
+        while len(frames) < self.frames_per_message and not self.queue.empty():
+            frames.append(self.queue.get_nowait())
+        self.latency = time.monotonic() - frames[0][0]
+        self.max_observed_latency = max(self.max_observed_latency, self.latency)
+        return frames
 
     async def streaming_loop(self):
         """실시간 스트리밍 루프"""
         logger.info("WebSocket 스트리밍 시작")
+        next_send = time.monotonic()
         
         while True:
             try:
@@ -158,31 +211,38 @@ class WebSocketStreamer:
                         await asyncio.sleep(5)
                         continue
                 
-                # 버퍼에서 오디오 데이터 가져오기
-                audio_data = None
-                async with self.buffer_lock:
-                    if self.stream_buffer:
-                        audio_data = self.stream_buffer.pop(0)
+                # 메시지 간격은 단조 시계 기준으로 유지, 밀린 프레임이 한 메시지보다 많으면 바로 전송해 따라잡음
+                now = time.monotonic()
+                if next_send > now and self.queue.qsize() < self.frames_per_message:
+                    await asyncio.sleep(next_send - now)
+                frames = await self._next_message()
+                next_send = max(next_send, time.monotonic() - self.streaming_interval) + self.streaming_interval
                 
-                if audio_data:
+                if frames:
                     try:
-                        await self.websocket.send(audio_data)
-                        self.sent_frames += 1
+                        raw = b''.join(data for _, data in frames)
+                        payload = self.codec.encode(raw)
+                        await self.websocket.send(payload)
+                        self.raw_bytes += len(raw)
+                        self.sent_bytes += len(payload)
+                        previous = self.sent_frames
+                        self.sent_frames += len(frames)
+                        self.sent_messages += 1
                         
                         # 통계 로깅 (1000프레임마다)
-                        if self.sent_frames % 1000 == 0:
-                            logger.info(f"WebSocket 전송 프레임: {self.sent_frames}")
+                        if self.sent_frames // 1000 != previous // 1000:
+                            logger.info(f"WebSocket 전송 프레임: {self.sent_frames}, 메시지: {self.sent_messages}, "
+                                        f"지연: {self.latency*1000:.0f}ms, 버린 프레임: {self.dropped_frames}")
                             
                     except websockets.exceptions.ConnectionClosed:
                         logger.warning("WebSocket 연결이 닫힘")
+                        self.dropped_send += len(frames)
                         self.is_connected = False
                     except Exception as e:
                         logger.error(f"WebSocket 전송 오류: {e}")
+                        self.dropped_send += len(frames)
                         self.is_connected = False
                 
-                # 스트리밍 간격 유지
-                await asyncio.sleep(self.streaming_interval)
-                
             except asyncio.CancelledError:
                 logger.info("WebSocket 스트리밍 태스크 취소됨")
                 break
@@ -198,6 +258,7 @@ class WebSocketStreamer:
             logger.info("WebSocket 스트리밍이 비활성화됨")
             return None
             
+        self.attach(asyncio.get_running_loop())
         # 초기 연결
         if await self.connect():
             # 스트리밍 태스크 시작
@@ -241,9 +302,9 @@ class WebSocketStreamer:
                 host = self.server_host
                 
             if self.server_port == 0:
-                self.ws_url = f"{protocol}://{host}/ws/room/{self.room_name}/{self.sample_rate}/int16/{self.device_id}"
+                self.ws_url = f"{protocol}://{host}/ws/room/{self.room_name}/{self.sample_rate}/{self.codec.name}/{self.device_id}"
             else:
-                self.ws_url = f"{protocol}://{host}:{self.server_port}/ws/room/{self.room_name}/{self.sample_rate}/int16/{self.device_id}"
+                self.ws_url = f"{protocol}://{host}:{self.server_port}/ws/room/{self.room_name}/{self.sample_rate}/{self.codec.name}/{self.device_id}"
             logger.info(f"WebSocket 설정 업데이트됨: {self.ws_url}")
             
             # 연결되어 있다면 재연결 필요
@@ -257,7 +318,18 @@ class WebSocketStreamer:
         return {
             "connected": self.is_connected,
             "sent_frames": self.sent_frames,
-            "buffer_size": len(self.stream_buffer),
+            "buffer_size": self.queue.qsize() if self.queue is not None else 0,
+            "sent_messages": self.sent_messages,
+            "dropped_frames": self.dropped_frames,
+            "dropped_overflow": self.dropped_overflow,
+            "dropped_latency": self.dropped_latency,
+            "dropped_send": self.dropped_send,
+            "latency": round(self.latency, 3),
+            "max_latency_observed": round(self.max_observed_latency, 3),
+            "frames_per_message": self.frames_per_message,
+            "codec": self.codec.name,
+            "compression_ratio": round(self.raw_bytes / self.sent_bytes, 2) if self.sent_bytes else None,
+            "max_latency": self.max_latency,
             "connection_retries": self.connection_retries
         }
 
@@ -275,9 +347,3 @@ async def start_websocket_streaming():
     """WebSocket 스트리밍 시작 (편의 함수)"""
     streamer = get_websocket_streamer()
     return await streamer.start_streaming()
-
-async def stream_audio_data(audio_data: bytes):
-    """오디오 데이터 스트리밍 (편의 함수)"""
-    if config.getboolean('options_using', 'websocket_streaming'):
-        streamer = get_websocket_streamer()
-        await streamer.add_audio_data(audio_data) 
\ No newline at end of file
@@ -1,56 +1,131 @@
 import subprocess
-import wave
+import wave, json, os
+import numpy as np
 from utils.init import config, deviceId, logger
 import aiohttp, asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from utils.audio_player import stop_current_playback, play_audio_file
+from utils.channels import select_channel, output_channels, DEFAULT_CHANNEL
+from utils.encoder import encode_wav_file
+from utils.http_client import get_session
+from utils.recordings import recordings_index
+from utils.archive import archive
 #from main import lock_count
 
+# Dedicated thread for segment writes, so slow SD cards never stall the event loop
+segment_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='segment-writer')
 
-def makeWavFile(filename, audioSampleSize, frames, dtype = 'byte'):
-    wf = wave.open(filename, 'wb')
-    wf.setnchannels(config.getint('audio', 'channels'))
-    wf.setsampwidth(audioSampleSize)
-    wf.setframerate(config.getint('audio', 'rate'))
+
+def makeWavFile(filename, audioSampleSize, frames, dtype = 'byte', meta = None, channel = None):
+    channels = config.getint('audio', 'channels')
+    if channel is None:
+        channel = config.get('audio', 'record_channel', fallback=DEFAULT_CHANNEL)
     if dtype == 'byte':
-        wf.writeframes(b''.join(frames))
+        segments = [b''.join(frames)]
+    elif dtype == 'view':
+        # Ring buffer segments are written as they are, without joining
+        segments = frames
     else:
-        wf.writeframes(frames)
+        segments = [frames]
+    if output_channels(channels, channel) != channels:
+        segments = [select_channel(np.frombuffer(segment, dtype=np.int16), channels, channel) for segment in segments]
+        channels = output_channels(channels, channel)
+    # Write to a temporary name and publish it atomically when complete
+    tmpname = filename + '.part'
+    wf = wave.open(tmpname, 'wb')
+    wf.setnchannels(channels)
+    wf.setsampwidth(audioSampleSize)
+    wf.setframerate(config.getint('audio', 'rate'))
+    for segment in segments:
+        wf.writeframesraw(segment)
     wf.close()
+    if meta is not None:
+        writeSegmentMeta(filename, dict(meta, channels=channels))
+    os.replace(tmpname, filename)
+    recordings_index.add(filename, meta)
+
+
+async def makeWavFileAsync(filename, audioSampleSize, frames, dtype = 'byte', meta = None, channel = None):
+    '''
+    makeWavFile on the segment writer thread; returns when the file is published
+    '''
+    await asyncio.get_running_loop().run_in_executor(
+        segment_writer, partial(makeWavFile, filename, audioSampleSize, frames, dtype, meta, channel))
+
+
+def appendArchive(frames, meta, channel = None):
+    '''
+    Append a segment to the hourly archive container instead of writing a wav file
+    '''
+    channels = config.getint('audio', 'channels')
+    if channel is None:
+        channel = config.get('audio', 'record_channel', fallback=DEFAULT_CHANNEL)
+    if output_channels(channels, channel) != channels:
+        frames = select_channel(frames, channels, channel)
+    archive.append(frames, meta['start_sample'], meta['start_time'])
+
+
+async def appendArchiveAsync(frames, meta, channel = None):
+    '''
+    appendArchive on the segment writer thread
+    '''
+    await asyncio.get_running_loop().run_in_executor(segment_writer, partial(appendArchive, frames, meta, channel))
+
+
+def writeSegmentMeta(filename, meta):
+    '''
+    Write the segment time index (start sample, start time, duration) as a json sidecar
+    '''
+    meta = dict(meta, device_id=str(deviceId), file=os.path.basename(filename))
+    metaname = os.path.splitext(filename)[0] + '.json'
+    with open(metaname + '.part', 'w') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(metaname + '.part', metaname)
 
     
 async def send_wav(filename):
-    # async with aiofiles.open(filename, 'rb') as sf:
-        # Send the wave file to the ML server
+    # Encode the segment for upload (wav, flac or opus) off the event loop
+    codec = config.get('files', 'send_codec', fallback='wav')
+    try:
+        name, payload, content_type = await asyncio.get_running_loop().run_in_executor(
+            None, encode_wav_file, filename, codec, config.get('files', 'opus_bitrate', fallback='24k'))
+    except Exception as e:
+        logger.warning(f'Encode audio ({codec}) - {e}')
+        name, payload, content_type = encode_wav_file(filename)
     timeout = aiohttp.ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        try:
-            data = aiohttp.FormData()
-            data.add_field('file',
-                        open(filename, 'rb'),
-                        filename=filename.split('/')[-1],
-                        content_type='audio/wav')
-            res = await session.post(f"{config['files']['send_url']}?threshold={config['speaker']['detect_threshold']}", data=data)
-            return res
-        except Exception as e:
-            logger.warning(f'Send audio - {e}')
-            return None
+    try:
+        data = aiohttp.FormData()
+        data.add_field('file',
+                    payload,
+                    filename=name,
+                    content_type=content_type)
+        res = await get_session().post(f"{config['files']['send_url']}?threshold={config['speaker']['detect_threshold']}", data=data, timeout=timeout)
+        return res
+    except Exception as e:
+        logger.warning(f'Send audio - {e}')
+        return None
 
 async def send_process(filename):
     res = await send_wav(filename)
     if res is not None:
-        if res.headers.get('content-type') != 'application/json':
-             # contentent-type is not json but status 200 when the server is not work properly
-            logger.warning(f'Send audio - {res}')
-        else:
-            event_res = await res.json()
-            print(f'{event_res["speaker"]}: {event_res["result"]}')
-            if (event_res['speaker'] == '성훈' and event_res['result'].startswith(' 안녕하세요') and config['speaker']['use_alarm'] == 'true'):
-                logger.info('Voice Detected!')
-                # Light the LED
-                subprocess.Popen(['python3', 'utils/pixels.py', 'alarm_light'])
-                # 기존 음원 정지 후 새 음원 재생
-                play_audio_file(config['speaker']['alarm_wav'])
-                return 'restart'
+        try:
+            if res.headers.get('content-type') != 'application/json':
+                 # contentent-type is not json but status 200 when the server is not work properly
+                logger.warning(f'Send audio - {res}')
+            else:
+                event_res = await res.json()
+                print(f'{event_res["speaker"]}: {event_res["result"]}')
+                if (event_res['speaker'] == '성훈' and event_res['result'].startswith(' 안녕하세요') and config['speaker']['use_alarm'] == 'true'):
+                    logger.info('Voice Detected!')
+                    # Light the LED
+                    subprocess.Popen(['python3', 'utils/pixels.py', 'alarm_light'])
+                    # 기존 음원 정지 후 새 음원 재생
+                    play_audio_file(config['speaker']['alarm_wav'])
+                    return 'restart'
+        finally:
+            # Return the connection to the shared pool
+            res.release()
     else:
         logger.warning('Send audio result is None - maybe network error')
             